@@ -1,10 +1,13 @@
+from eval import depio
+
+
 class Vocab(object):
     def __init__(self,filename):
         self.words = []
         self.word2idx = {}
         self.unk_index = -1
         self.unk_token = 'unk'
-        with open(filename) as reader:
+        with depio.smart_open(filename) as reader:
             data = reader.readlines()
             for line in data:
                 if line.strip() != 'PTB_KBEST' and '_' in line:
@@ -0,0 +1,94 @@
+import threading
+import numpy as np
+import data_util
+import np_model
+import checkpoint
+import scoring
+from eval import eval as eval_tool
+
+
+def stratified_sample(data, size):
+    """Every (len(data) / size)-th instance in sentence-length order, so the
+    sample follows the length distribution of the whole set."""
+    if size >= len(data):
+        return list(data)
+    order = sorted(range(len(data)), key=lambda i: len(data[i].gold_heads))
+    return [data[order[i]] for i in np.linspace(0, len(data) - 1, size).astype(int)]
+
+
+def evaluate(scorer, data):
+    # trees are built fresh instead of taken from the shared cache, since the
+    # training thread rewrites node indices of the trees it is working on
+    counter = eval_tool.corpus_eval()
+    for inst in data:
+        size = inst.gold.size
+        scores = []
+        for j in range(inst.k):
+            tree = data_util.build_tree(inst.vals, inst.get_heads(j).tolist())
+            scores.append(scorer.predict(tree) if tree.size == size else -np.inf)
+        inst.add_eval(counter, scoring.select(inst, scores, False, 1))
+    return counter.result()[0]
+
+
+class background_evaluator(object):
+    """Evaluates parameter snapshots on a dev subsample in a background
+    thread, runs a full dev evaluation only when the subsample improves and
+    keeps the best full-dev snapshot on disk, as a parameter file in
+    best_file and, with the gates and adagrad state, as a checkpoint in
+    best_checkpoint."""
+    def __init__(self, dev_data, sample_size, patience, best_file, best_checkpoint=None, vocab=None):
+        self.dev_data = dev_data
+        self.sample = stratified_sample(dev_data, sample_size)
+        self.patience = patience
+        self.best_file = best_file
+        self.best_checkpoint = best_checkpoint
+        self.vocab = vocab
+        self.best_sample = 0
+        self.best_uas = 0
+        self.bad_rounds = 0
+        self.thread = None
+        self.last_version = 0
+
+    def maybe_submit(self, model, every):
+        if model.param_version - self.last_version >= every and self.submit(model):
+            self.last_version = model.param_version
+
+    def submit(self, model, final=False):
+        """Start evaluating a snapshot unless the previous one is still running.
+        A final snapshot always gets the full dev evaluation and the
+        comparison with the best one, whatever its subsample score."""
+        if self.thread is not None and self.thread.is_alive():
+            return False
+        # get_value copies, so the snapshot does not change while training goes on
+        arrays = checkpoint.model_arrays(model)
+        meta = checkpoint.model_meta(model, self.vocab)
+        scorer = np_model.numpy_scorer(arrays, model.degree, model.param_version)
+        self.thread = threading.Thread(target=self.run, args=(scorer, arrays, meta, final))
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def run(self, scorer, arrays, meta, final=False):
+        uas = evaluate(scorer, self.sample)
+        print 'update %d subsample f1score: %.4f' % (scorer.param_version, uas)
+        if uas <= self.best_sample:
+            self.bad_rounds += 1
+            if not final:
+                return
+        else:
+            self.best_sample = uas
+            self.bad_rounds = 0
+        uas = evaluate(scorer, self.dev_data)
+        print 'update %d dev f1score: %.4f' % (scorer.param_version, uas)
+        if uas > self.best_uas:
+            self.best_uas = uas
+            np_model.save_params(scorer, self.best_file)
+            if self.best_checkpoint is not None:
+                checkpoint.save_checkpoint(self.best_checkpoint, arrays, meta)
+
+    def should_stop(self):
+        return self.bad_rounds >= self.patience
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
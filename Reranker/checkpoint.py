@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import struct
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+# file layout: MAGIC, header length (little-endian uint64), JSON header,
+# then every array's raw C-order bytes starting at an ALIGN-byte boundary
+MAGIC = 'RRCKPT1\n'
+ALIGN = 64
+# model.params order, which is also the order of data_util.save_model files
+PARAM_NAMES = ['embeddings',
+               'W_i', 'U_i', 'b_i',
+               'W_f', 'U_f', 'b_f',
+               'W_o', 'U_o', 'b_o',
+               'W_u', 'U_u', 'b_u',
+               'W_out', 'b_out']
+GATE_NAMES = ['W_gate', 'U_gate', 'b_gate']
+ACCU_PREFIX = 'accu/'
+
+
+def aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def is_checkpoint(filename):
+    with open(filename, 'rb') as reader:
+        return reader.read(len(MAGIC)) == MAGIC
+
+
+def vocab_hash(vocab):
+    return hashlib.sha1('\n'.join(vocab.words)).hexdigest()
+
+
+def save_checkpoint(output_file, arrays, meta):
+    """Write an OrderedDict of named arrays and a JSON-serializable meta dict."""
+    arrays = OrderedDict((name, np.ascontiguousarray(value)) for name, value in arrays.items())
+    entries = []
+    offset = 0
+    for name, value in arrays.items():
+        entries.append({'name': name, 'dtype': value.dtype.str, 'shape': value.shape, 'offset': offset})
+        offset = aligned(offset + value.nbytes)
+    header = json.dumps({'meta': meta, 'arrays': entries})
+    start = aligned(len(MAGIC) + 8 + len(header))
+    # write to a temporary name first so an interrupted run never leaves a truncated checkpoint
+    output = open(output_file + '.tmp', 'wb')
+    output.write(MAGIC)
+    output.write(struct.pack('<Q', len(header)))
+    output.write(header)
+    for entry, value in zip(entries, arrays.values()):
+        output.write('\0' * (start + entry['offset'] - output.tell()))
+        output.write(value.tostring())
+    output.close()
+    os.rename(output_file + '.tmp', output_file)
+
+
+def load_checkpoint(input_file, mmap=True):
+    """Named arrays and meta dict of a checkpoint. With mmap the arrays are
+    read-only views of the file, so processes loading the same checkpoint
+    share its pages instead of holding private copies."""
+    with open(input_file, 'rb') as reader:
+        if reader.read(len(MAGIC)) != MAGIC:
+            raise IOError('%s is not a checkpoint' % input_file)
+        length, = struct.unpack('<Q', reader.read(8))
+        header = json.loads(reader.read(length))
+    start = aligned(len(MAGIC) + 8 + length)
+    arrays = OrderedDict()
+    for entry in header['arrays']:
+        dtype = np.dtype(str(entry['dtype']))
+        shape = tuple(entry['shape'])
+        offset = start + entry['offset']
+        if not mmap or int(np.prod(shape)) == 0:
+            with open(input_file, 'rb') as reader:
+                reader.seek(offset)
+                value = np.fromfile(reader, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+        else:
+            # plain ndarray view: memmap subclass overhead on every op slows scoring
+            value = np.memmap(input_file, dtype=dtype, mode='r', offset=offset, shape=shape).view(np.ndarray)
+        arrays[str(entry['name'])] = value
+    return arrays, header['meta']
+
+
+def model_arrays(model):
+    """Parameters, compare-gate weights and adagrad accumulators by name."""
+    arrays = OrderedDict()
+    for name in PARAM_NAMES + GATE_NAMES:
+        arrays[name] = getattr(model, name).get_value()
+    for name, accu in zip(PARAM_NAMES, model.accumulators):
+        arrays[ACCU_PREFIX + name] = accu.get_value()
+    return arrays
+
+
+def model_meta(model, vocab=None):
+    return {'num_emb': model.num_emb, 'emb_dim': model.emb_dim,
+            'hidden_dim': model.hidden_dim, 'output_dim': model.output_dim,
+            'degree': model.degree, 'param_version': model.param_version,
+            'vocab_hash': vocab_hash(vocab) if vocab is not None else None}
+
+
+def save_model(model, output_file, vocab=None):
+    save_checkpoint(output_file, model_arrays(model), model_meta(model, vocab))
+
+
+def check_vocab(meta, vocab):
+    """Warn when a checkpoint was trained with a different vocabulary."""
+    if meta.get('vocab_hash') is not None and meta['vocab_hash'] != vocab_hash(vocab):
+        sys.stderr.write('warning: checkpoint vocabulary hash %s does not match the dictionary\n' % meta['vocab_hash'])
+        return False
+    return True
@@ -0,0 +1,80 @@
+import os
+import time
+import argparse
+import numpy as np
+import data_util
+import dev_reader
+import np_model
+import parallel_eval
+import scoring
+
+RATIOS = 0.005 * np.arange(200)
+
+
+def evaluate_scores(data, model_scores, ratios):
+    """Model-only UAS, the sweep curve over ratios and its best ratio."""
+    model, base, correct, total = scoring.sweep_matrices(data, model_scores)
+    model_only, _ = scoring.sweep(model, base, correct, total, [1])
+    curve, best = scoring.sweep(model, base, correct, total, ratios)
+    return model_only[0], curve, best
+
+
+def evaluate_checkpoint(path):
+    shared = parallel_eval.shared
+    start = time.time()
+    scorer = np_model.load_params(path, shared['degree'])
+    row = {'checkpoint': path}
+    dev_scores = [scoring.score_instance(scorer, inst) for inst in shared['dev']]
+    row['dev'], curve, row['ratio'] = evaluate_scores(shared['dev'], dev_scores, shared['ratios'])
+    row['dev_mixed'] = curve.max()
+    if shared['test'] is not None:
+        test_scores = [scoring.score_instance(scorer, inst) for inst in shared['test']]
+        row['test'], curve, _ = evaluate_scores(shared['test'], test_scores, [row['ratio']])
+        row['test_mixed'] = curve[0]
+    row['seconds'] = time.time() - start
+    return row
+
+
+def sweep_checkpoints(paths, degree, dev_data, test_data=None, ratios=RATIOS, workers=1):
+    """Evaluate every checkpoint on preprocessed dev (and test) data, in
+    worker processes when workers > 1 (see parallel_eval.pool_map). Test is
+    scored at the ratio that is best on dev."""
+    return parallel_eval.pool_map(evaluate_checkpoint, paths, workers, 1, degree=degree,
+                                  dev=dev_data, test=test_data, ratios=ratios)
+
+
+def print_table(rows):
+    width = max([len('checkpoint')] + [len(os.path.basename(row['checkpoint'])) for row in rows])
+    has_test = 'test' in rows[0]
+    header = '%-*s %8s %6s %9s' % (width, 'checkpoint', 'dev', 'ratio', 'dev+base')
+    if has_test:
+        header += ' %8s %9s' % ('test', 'test+base')
+    print header + ' %7s' % 'seconds'
+    best = max(rows, key=lambda row: row['dev_mixed'])
+    for row in rows:
+        line = '%-*s %8.4f %6.3f %9.4f' % (width, os.path.basename(row['checkpoint']), row['dev'],
+                                           row['ratio'], row['dev_mixed'])
+        if has_test:
+            line += ' %8.4f %9.4f' % (row['test'], row['test_mixed'])
+        print line + ' %7.1f%s' % (row['seconds'], ' *' if row is best else '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare many saved models on the same dev/test data.')
+    parser.add_argument('dict', help='vocabulary pickle written by data_util.save_dict')
+    parser.add_argument('checkpoints', nargs='+', help='parameter files or checkpoints')
+    parser.add_argument('--dev', nargs=2, required=True, metavar=('KBEST', 'GOLD'))
+    parser.add_argument('--test', nargs=2, metavar=('KBEST', 'GOLD'))
+    parser.add_argument('-w', '--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    degree, vocab = data_util.load_dict(args.dict)
+    start = time.time()
+    dev_data = dev_reader.read_dev(args.dev[0], args.dev[1], vocab)
+    test_data = dev_reader.read_dev(args.test[0], args.test[1], vocab) if args.test else None
+    print 'data loaded in %.2fs' % (time.time() - start)
+    print_table(sweep_checkpoints(args.checkpoints, degree, dev_data, test_data, workers=args.workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import os
+import time
+import hashlib
+import cPickle as pickle
+
+# bump whenever the layout of data_util.instance changes so stale caches miss
+CACHE_VERSION = 7
+HASH_BLOCK = 1 << 20
+
+
+def file_hash(filename):
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as reader:
+        block = reader.read(HASH_BLOCK)
+        while block:
+            sha.update(block)
+            block = reader.read(HASH_BLOCK)
+    return sha.hexdigest()
+
+
+def cache_key(filenames):
+    sha = hashlib.sha1()
+    sha.update('version:%d' % CACHE_VERSION)
+    for filename in filenames:
+        if filename is not None and os.path.exists(filename):
+            sha.update(file_hash(filename))
+        else:
+            sha.update('missing')
+    return sha.hexdigest()
+
+
+def cache_file(cache_dir, key):
+    return os.path.join(cache_dir, 'data_%s.pkl' % key)
+
+
+def load_data(cache_dir, key):
+    filename = cache_file(cache_dir, key)
+    if not os.path.exists(filename):
+        print 'dataset cache miss: %s' % key
+        return None
+    start = time.time()
+    pkl_file = open(filename, 'rb')
+    data = pickle.load(pkl_file)
+    pkl_file.close()
+    print 'dataset cache hit: %s load time %.2fs' % (key, time.time() - start)
+    return data
+
+
+def save_data(cache_dir, key, data):
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    filename = cache_file(cache_dir, key)
+    start = time.time()
+    # write to a temporary name first so an interrupted run never leaves a truncated cache
+    output = open(filename + '.tmp', 'wb')
+    pickle.dump(data, output, protocol=2)
+    output.close()
+    os.rename(filename + '.tmp', filename)
+    print 'dataset cache saved: %s save time %.2fs' % (key, time.time() - start)
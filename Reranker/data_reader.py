@@ -2,6 +2,8 @@ import os
 import Vocab
 import data_util
 import dev_reader
+import data_cache
+from eval import depio
 
 
 
@@ -9,7 +11,7 @@ import dev_reader
 class data_manager(object):
     max_degree = 0
     def __init__(self,batch,train_kbest = None,train_gold = None,dev_kbest = None,dev_gold = None,
-                 test_kbest = None,test_gold = None,vocab_path = None):
+                 test_kbest = None,test_gold = None,vocab_path = None,cache_dir = None):
         self.vocab = None
         self.train_kbest = train_kbest
         self.train_gold = train_gold
@@ -30,6 +32,14 @@ class data_manager(object):
             data_util.save_dict(self.vocab,self.max_degree, vocab_path)
         print 'vocab size:' + str(self.vocab.size())
         print 'max_degree' + str(self.max_degree)
+        if cache_dir is not None:
+            key = data_cache.cache_key([train_kbest, train_gold, dev_kbest, dev_gold, vocab_path])
+            cached = data_cache.load_data(cache_dir, key)
+            if cached is not None:
+                self.dev_data, self.train_data = cached
+                print 'number of dev:'+str(len(self.dev_data))
+                print 'number of train:'+str(len(self.train_data))
+                return
         print 'get dev data'
         self.dev_data = dev_reader.read_dev(dev_kbest,dev_gold,self.vocab)
         print 'number of dev:'+str(len(self.dev_data))
@@ -39,11 +49,16 @@ class data_manager(object):
         print 'get train data'
         self.train_data = dev_reader.read_dev(train_kbest,train_gold,self.vocab)
         print 'number of train:'+str(len(self.train_data))
+        print 'get f1 score'
+        for inst in self.train_data:
+            inst.set_f1()
+        if cache_dir is not None:
+            data_cache.save_data(cache_dir, key, (self.dev_data, self.train_data))
 
     def get_max_degree(self):
         retval = 0
         for file in [self.train_kbest, self.train_gold, self.dev_gold, self.dev_kbest]:
-            f = open(file)
+            f = depio.smart_open(file)
             line = f.readline()
             list = []
             while line:
@@ -63,6 +78,7 @@ class data_manager(object):
                     list = []
 
                 line = f.readline()
+            f.close()
         return retval
 
 
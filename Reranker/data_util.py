@@ -1,48 +1,245 @@
 import pickle
 import math
+import threading
+import numpy as np
+from collections import OrderedDict
 from eval import eval as eval_tool
+import tree_rnn
+
+# number of materialized trees / line lists kept alive across all instances
+CACHE_SIZE = 64
+LOG_BASE = math.log(1.1)
+
+
+class lru_cache(object):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.pop(key, None)
+            if value is not None:
+                self.items[key] = value
+            return value
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = value
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+materialized = lru_cache(CACHE_SIZE)
+
+
+def set_cache_size(size):
+    materialized.capacity = size
+    materialized.clear()
+
+
+class lazy_list(object):
+    """Read-only sequence whose items are built by the instance on access."""
+    def __init__(self, inst, kind, size):
+        self.inst = inst
+        self.kind = kind
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, j):
+        if j < 0:
+            j += self.size
+        if j < 0 or j >= self.size:
+            raise IndexError(j)
+        return self.inst.materialize(self.kind, j)
+
+    def __iter__(self):
+        for j in range(self.size):
+            yield self.inst.materialize(self.kind, j)
 
 
 class instance(object):
-    def __init__(self,kbest,scores,gold,lines,gold_lines):
-        self.kbest = kbest
+    # one token table per sentence (every column except head and label), the
+    # heads/labels of the 1-best candidate in full and every candidate as a
+    # flat list of (token, head, label) edits against it; trees and CoNLL
+    # line lists are rebuilt on demand
+    def __init__(self,table,heads,labels,scores,gold_table,gold_heads,gold_labels,vals,gold_vals):
+        for j, h in enumerate(heads):
+            if len(h) != len(table):
+                raise ValueError('candidate %d has %d tokens, the sentence has %d' % (j, len(h), len(table)))
+        if len(gold_heads) != len(table):
+            raise ValueError('gold tree has %d tokens, the sentence has %d' % (len(gold_heads), len(table)))
+        self.label_names = sorted(set(gold_labels).union(*labels))
+        label_ids = dict((l, i) for i, l in enumerate(self.label_names))
+        heads = np.array(heads, dtype='int16')
+        labels = np.array([[label_ids[l] for l in ls] for ls in labels], dtype='int16')
+        self.k = len(heads)
+        self.base = scores.index(max(scores)) if scores else 0
+        self.base_heads = heads[self.base]
+        self.base_labels = labels[self.base]
+        cand, tok = np.nonzero((heads != self.base_heads) | (labels != self.base_labels))
+        self.edits = np.column_stack([tok, heads[cand, tok], labels[cand, tok]]).astype('int16')
+        self.offsets = np.searchsorted(cand, np.arange(self.k + 1)).astype('int32')
+        self.table = table
         self.scores = scores
-        self.gold = gold
-        self.gold_lines = gold_lines
-        self.lines = lines
+        self.norm_scores = normalize(scores)
+        self.gold_table = table if gold_table == table else gold_table
+        self.gold_heads = np.array(gold_heads, dtype='int16')
+        self.gold_labels = np.array([label_ids[l] for l in gold_labels], dtype='int16')
+        self.vals = vals
+        self.gold_vals = gold_vals
+        # non-punctuation tokens of the gold sentence, the only ones scored
+        self.mask = eval_tool.punct_mask(self.gold_words())
         self.f1score = []
         #self.maxid = self.get_oracle_index()
 
+    def diff(self, j):
+        """(token, head, label) edits turning the 1-best candidate into candidate j."""
+        return self.edits[self.offsets[j]:self.offsets[j + 1]]
+
+    def get_heads(self, j):
+        edits = self.diff(j)
+        heads = self.base_heads.copy()
+        heads[edits[:, 0]] = edits[:, 1]
+        return heads
+
+    def get_labels(self, j):
+        edits = self.diff(j)
+        labels = self.base_labels.copy()
+        labels[edits[:, 0]] = edits[:, 2]
+        return labels
+
+    def gold_words(self):
+        return [prefix.split()[1] for prefix, suffix in self.gold_table]
+
+    def add_eval(self, counter, j):
+        """Score candidate j against gold into an eval_tool.corpus_eval."""
+        counter.add(self.get_heads(j), self.get_labels(j), self.gold_heads, self.gold_labels, self.mask)
+
+    def correct_heads(self):
+        """Number of correctly attached scored tokens of every candidate."""
+        heads, labels = self.arcs()
+        return ((heads == self.gold_heads) & self.mask).sum(axis=1)
+
+    def arcs(self):
+        """Decode all candidates into (k x n) head and label matrices."""
+        heads = np.tile(self.base_heads, (self.k, 1))
+        labels = np.tile(self.base_labels, (self.k, 1))
+        cand = np.repeat(np.arange(self.k), np.diff(self.offsets))
+        heads[cand, self.edits[:, 0]] = self.edits[:, 1]
+        labels[cand, self.edits[:, 0]] = self.edits[:, 2]
+        return heads, labels
+
+    @property
+    def kbest(self):
+        return lazy_list(self, 'tree', self.k)
+
+    @property
+    def lines(self):
+        return lazy_list(self, 'lines', self.k)
+
+    @property
+    def gold(self):
+        return self.materialize('gold', 0)
+
+    @property
+    def gold_lines(self):
+        return self.materialize('gold_lines', 0)
+
+    def materialize(self, kind, j):
+        key = (self, kind, j)
+        value = materialized.get(key)
+        if value is None:
+            if kind == 'tree':
+                value = build_tree(self.vals, self.get_heads(j).tolist())
+            elif kind == 'lines':
+                value = to_conll(self.table, self.get_heads(j), self.get_labels(j), self.label_names)
+            elif kind == 'gold':
+                value = build_tree(self.gold_vals, self.gold_heads.tolist())
+            else:
+                value = to_conll(self.gold_table, self.gold_heads, self.gold_labels, self.label_names)
+            materialized.put(key, value)
+        return value
+
     def set_f1(self):
-        for l in self.lines:
-            f1 = eval_tool.evaluate(l, self.gold_lines)[0]
-            self.f1score.append(f1)
+        # an all-punctuation sentence has nothing to score, every candidate gets 0
+        self.f1score = (self.correct_heads() / float(max(self.mask.sum(), 1))).tolist()
 
     def get_oracle_index(self):
-        max = 0
-        maxid = 0
-        i = 0
-        for list in self.lines:
-            temp = []
-            for line in list:
-                temp.append(line)
-            temp.append('\n')
-            res = eval_tool.evaluate(temp, self.gold_lines)[0]
-            if res > max:
-                max = res
-                maxid = i
-            i += 1
-        return maxid
-
-def normalize(list):
-    sum = 0
-    max_score = max(list)
-    for i in range(len(list)):
-        list[i] = math.pow(1.1, list[i]-max_score)
-        sum += list[i]
-
-    for i in range(len(list)):
-        list[i] = math.log(list[i]/sum, 1.1)
+        return int(np.argmax(self.correct_heads()))
+
+
+def get_vals(list, vocab):
+    vals = []
+    for line in list:
+        word = line.split()[1]
+        if vocab is None:
+            vals.append(word)
+        else:
+            vals.append(vocab.index(word))
+    return vals
+
+
+def read_table(list):
+    """Split CoNLL lines into a token table (prefix and suffix around the
+    head and label columns), the heads and the labels."""
+    table = []
+    heads = []
+    labels = []
+    for line in list:
+        cols = line.split()
+        table.append(('\t'.join(cols[:6]), ''.join('\t' + c for c in cols[8:])))
+        heads.append(int(cols[6]))
+        labels.append(cols[7])
+    return table, heads, labels
+
+
+def read_arcs(list):
+    heads = []
+    labels = []
+    for line in list:
+        cols = line.split()
+        heads.append(int(cols[6]))
+        labels.append(cols[7])
+    return heads, labels
+
+
+def to_conll(table, heads, labels, label_names):
+    return ['%s\t%d\t%s%s\n' % (prefix, head, label_names[label], suffix)
+            for (prefix, suffix), head, label in zip(table, heads, labels)]
+
+
+def build_tree(vals, heads):
+    nodes = [tree_rnn.Node(val) for val in vals]
+    root = None
+    for i in range(len(heads)):
+        parent = heads[i] - 1
+        if parent >= 0:
+            nodes[parent].add_child(nodes[i])
+        elif parent == -1:
+            root = nodes[i]
+    return root
+
+
+def normalize(scores):
+    """Base-1.1 log-softmax over the last axis of a score vector or padded
+    score matrix; -inf entries (padding) stay -inf. Returns a new array."""
+    scores = np.asarray(scores, dtype='float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        top = scores.max(axis=-1)[..., np.newaxis]
+        shifted = (scores - np.where(np.isfinite(top), top, 0)) * LOG_BASE
+        total = np.exp(shifted).sum(axis=-1)[..., np.newaxis]
+        return (shifted - np.log(total)) / LOG_BASE
 
 
 
@@ -70,4 +267,4 @@ def load_model(input_file):
     pkl_file = open(input_file, 'rb')
     params = pickle.load(pkl_file)
     pkl_file.close()
-    return params
\ No newline at end of file
+    return params
@@ -6,11 +6,17 @@ import data_util
 import tree_lstm
 import tree_rnn
 import data_reader
+import checkpoint
 FINE_GRAINED = False
 DEPENDENCY = False
 SEED = 88
 
 LEARNING_RATE = 0.1
+# train_step2 feeds each candidate's ungated states, computed once per
+# instance, to the margin updates instead of recomputing them per pair
+# (faster, but the states go stale within the instance and no gradient
+# flows through them, see TreeRNN.train_margin_states)
+REUSE_COMPARE_STATES = False
 
 EMB_DIM = 50
 HIDDEN_DIM = 200
@@ -19,6 +25,10 @@ OUTPUT_DIM = 3
 
 
 class DependencyModel(tree_lstm.ChildSumTreeLSTM):
+    # the compare gate is not in self.params, so it keeps its random
+    # initialization unless restored from a checkpoint
+    gates_loaded = False
+
     def set_parmas(self,input_file):
         pkl_file = open(input_file, 'rb')
         self.embeddings.set_value(pickle.load(pkl_file))
@@ -37,6 +47,25 @@ class DependencyModel(tree_lstm.ChildSumTreeLSTM):
         self.W_out.set_value(pickle.load(pkl_file))
         self.b_out.set_value(pickle.load(pkl_file))
         pkl_file.close()
+        self.param_version += 1
+
+    def load_checkpoint(self, input_file):
+        """Load the named parameters, gate weights and adagrad accumulators
+        of a checkpoint written by checkpoint.save_model; returns its meta."""
+        arrays, meta = checkpoint.load_checkpoint(input_file)
+        self.load_arrays(arrays)
+        return meta
+
+    def load_arrays(self, arrays):
+        """Set parameters and accumulators from checkpoint.load_checkpoint arrays."""
+        for name in checkpoint.PARAM_NAMES + checkpoint.GATE_NAMES:
+            if name in arrays:
+                getattr(self, name).set_value(np.array(arrays[name]))
+        self.gates_loaded = all(name in arrays for name in checkpoint.GATE_NAMES)
+        for name, accu in zip(checkpoint.PARAM_NAMES, self.accumulators):
+            if checkpoint.ACCU_PREFIX + name in arrays:
+                accu.set_value(np.array(arrays[checkpoint.ACCU_PREFIX + name]))
+        self.param_version += 1
 
 
     def create_output_fn(self):
@@ -52,14 +81,18 @@ class DependencyModel(tree_lstm.ChildSumTreeLSTM):
         lens = len(inst.kbest)
         losses = 0
         max = 0
+        buffer = tree_rnn.state_buffer(self)
         for j in range(1,lens):
             if inst.f1score[max] > inst.f1score[j]:
                 gold = inst.kbest[max]
-                pred = inst.kbest[j]
+                pred, pred_id = inst.kbest[j], j
             else:
                 gold = inst.kbest[j]
-                pred = inst.kbest[max]
-            loss = np.mean(self.train_margin(gold,pred))
+                pred, pred_id = inst.kbest[max], max
+            if REUSE_COMPARE_STATES:
+                loss = np.mean(self.train_margin_states(gold, pred, buffer.get(pred_id, pred)))
+            else:
+                loss = np.mean(self.train_margin(gold,pred))
             if loss > 0:
                 losses += loss
         return losses
@@ -98,3 +131,12 @@ def get_model(num_emb, max_degree):
         labels_on_nonroot_nodes=False,
         irregular_tree=True)
 
+
+def from_checkpoint(input_file):
+    """Build a model with the vocabulary size and degree of a checkpoint and
+    load it; the checkpoint's metadata is kept as model.meta."""
+    arrays, meta = checkpoint.load_checkpoint(input_file)
+    model = get_model(meta['num_emb'], meta['degree'])
+    model.load_arrays(arrays)
+    model.meta = meta
+    return model
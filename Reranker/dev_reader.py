@@ -1,58 +1,99 @@
+import itertools
 import data_util
-import train_iterator
+import kbest_delta
+from eval import depio
 
 
-def read_dev(kbest_filename, gold_filename, vocab):
-    with open(kbest_filename, 'r') as reader:
-        kbest_data = reader.readlines()
-    kbest_data.append('PTB_KBEST')
-    reader.close()
-    kbest = []
-    scores = []
-    onebest = []
+def read_kbest(kbest_data, vocab):
+    """Yield (table, heads, labels, scores, vals) for every PTB_KBEST block
+    with more than one candidate, and None for single-candidate blocks so
+    the blocks stay aligned with the gold file."""
+    oneheads = []
+    onelabels = []
     tree = []
     onescores = []
-    lines = []
-    onelines = []
-    i = 0
-    while i < len(kbest_data):
-        line = kbest_data[i]
+    for line in kbest_data:
         if line.strip() != 'PTB_KBEST':
             if line.strip() == '':
-                onelines.append(tree[:])
-                onebest.append(train_iterator.read_tree(tree,vocab))
+                if len(oneheads) == 0:
+                    onetable, h, l = data_util.read_table(tree)
+                    onevals = data_util.get_vals(tree, vocab)
+                else:
+                    h, l = data_util.read_arcs(tree)
+                oneheads.append(h)
+                onelabels.append(l)
                 tree = []
             elif not '_' in line:
                 onescores.append(float(line))
             else:
                 tree.append(line)
         else:
-            if len(onebest) > 1:
-                kbest.append(onebest[:])
-                scores.append(onescores[:])
-                lines.append(onelines)
-                onelines = []
-                onebest = []
-                onescores = []
-        i += 1
+            if len(oneheads) > 1:
+                yield onetable, oneheads, onelabels, onescores, onevals
+            elif oneheads:
+                yield None
+            # reset on every block, a skipped single-candidate block must not
+            # leak its table, heads or scores into the next one
+            oneheads = []
+            onelabels = []
+            onescores = []
+            tree = []
+
+
+def read_blocks(kbest_data):
+    """Yield (candidates, scores) for every PTB_KBEST block of a stream, where
+    candidates is a list of CoNLL line lists. Unlike read_kbest, blocks with
+    a single candidate are kept so the output stays aligned with the input."""
+    candidates = []
+    scores = []
+    tree = []
+    for line in kbest_data:
+        if line.strip() == 'PTB_KBEST':
+            if candidates:
+                yield candidates, scores
+            candidates = []
+            scores = []
+        elif line.strip() == '':
+            if tree:
+                candidates.append(tree)
+            tree = []
+        elif not '_' in line:
+            scores.append(float(line))
+        else:
+            tree.append(line)
+    if tree:
+        candidates.append(tree)
+    if candidates:
+        yield candidates, scores
 
-    with open(gold_filename, 'r') as reader:
-        data = reader.readlines()
+
+def read_dev(kbest_filename, gold_filename, vocab):
+    reader = depio.smart_open(kbest_filename)
+    first = reader.readline()
+    kbest_data = itertools.chain([first], reader, ['PTB_KBEST'])
+    if first.strip() == kbest_delta.HEADER:
+        kbest = list(kbest_delta.read_kbest(kbest_data, vocab))
+    else:
+        kbest = list(read_kbest(kbest_data, vocab))
     reader.close()
-    list = []
+
     gold = []
-    gold_lines = []
-    for line in data:
-        if line.strip() == '':
-            root = train_iterator.read_tree(list,vocab)
-            gold.append(root)
-            gold_lines.append(list[:])
-            list = []
-        else:
-            list.append(line)
+    with depio.smart_open(gold_filename) as reader:
+        sent = []
+        for line in reader:
+            if line.strip() == '':
+                table, h, l = data_util.read_table(sent)
+                gold.append((table, h, l, data_util.get_vals(sent, vocab)))
+                sent = []
+            else:
+                sent.append(line)
     dev_data = []
-    for a,b,c,d,e in zip(kbest, scores, gold, lines, gold_lines):
-        if len(c.children) == 0:
+    for block, f in zip(kbest, gold):
+        if block is None:
+            continue
+        a, b, c, d, e = block
+        root = data_util.build_tree(f[3], f[1])
+        if len(root.children) == 0:
             continue
-        dev_data.append(data_util.instance(a,b,c,d,e))
+        dev_data.append(data_util.instance(a,b,c,d,f[0],f[1],f[2],e,f[3]))
     return dev_data
@@ -1,8 +1,36 @@
+import io
 import sys
+import gzip
+import bz2
+try:
+   import lzma
+except ImportError:
+   try:
+      from backports import lzma
+   except ImportError:
+      lzma = None
+
+BUFFER_SIZE = 1 << 20
+
+def smart_open(path):
+   """open a plain, gzip, bz2 or xz text file for buffered streaming reads;
+   the format is taken from the extension or the leading magic bytes"""
+   file = open(path, 'rb')
+   magic = file.read(6)
+   file.close()
+   if path.endswith('.gz') or magic[:2] == '\x1f\x8b':
+      return io.BufferedReader(gzip.open(path, 'rb'), BUFFER_SIZE)
+   if path.endswith('.bz2') or magic[:3] == 'BZh':
+      return bz2.BZ2File(path, 'r', BUFFER_SIZE)
+   if path.endswith('.xz') or magic == '\xfd7zXZ\x00':
+      if lzma is None:
+         raise IOError('reading %s needs the lzma module (backports.lzma on python 2)' % path)
+      return io.BufferedReader(lzma.LZMAFile(path, 'rb'), BUFFER_SIZE)
+   return open(path, 'r', BUFFER_SIZE)
 
 def depread(path):
    """read dependency trees"""
-   file = open(path)
+   file = smart_open(path)
    sent = []
    for line in file:
       if not line.strip():
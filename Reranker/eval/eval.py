@@ -1,6 +1,9 @@
 # -encoding:utf8-
 import re
 import sys
+import itertools
+
+import numpy as np
 
 import depio
 
@@ -45,7 +48,90 @@ def evaluate(lines , gold):
    #print float(correct_head) / total, float(correct_label) / total, float(total_uem) / total_sent
    return [float(correct_head) / total, float(correct_label) / total, float(total_uem) / total_sent]
 
+def punct_mask(words):
+   """True for every token that is scored (not punctuation)"""
+   return np.array([not g_reP.match(word) for word in words], dtype=bool)
+
+class corpus_eval(object):
+   """accumulate correct head, correct label, total and UEM counts from int
+   head/label arrays one sentence at a time; result() matches evaluate()"""
+   def __init__(self):
+      self.correct_head = []
+      self.correct_label = []
+      self.total = []
+      self.uem = []
+
+   def add(self, heads, labels, gold_heads, gold_labels, mask):
+      head_ok = (heads == gold_heads) & mask
+      correct_head = int(head_ok.sum())
+      total = int(mask.sum())
+      self.correct_head.append(correct_head)
+      self.correct_label.append(int((head_ok & (labels == gold_labels)).sum()))
+      self.total.append(total)
+      self.uem.append(int(correct_head == total))
+
+   def merge(self, other):
+      self.correct_head.extend(other.correct_head)
+      self.correct_label.extend(other.correct_label)
+      self.total.extend(other.total)
+      self.uem.extend(other.uem)
+
+   def sentence_counts(self):
+      """per-sentence (correct head, total) arrays"""
+      return np.array(self.correct_head), np.array(self.total)
+
+   def result(self):
+      total = float(sum(self.total))
+      return [sum(self.correct_head) / total, sum(self.correct_label) / total, float(sum(self.uem)) / len(self.uem)]
+
+def read_gold(path, label_ids):
+   """parse a reference file once into (words, heads, labels, mask) arrays"""
+   gold = []
+   for sent in depio.depread(path):
+      words = [word[1] for word in sent]
+      heads = np.array([int(word[6]) for word in sent])
+      labels = np.array([label_ids.setdefault(word[7], len(label_ids)) for word in sent])
+      gold.append((words, heads, labels, punct_mask(words)))
+   return gold
+
+def evaluate_systems(reference, outputs):
+   return [counter.result() for counter in system_counters(reference, outputs)]
+
+def system_counters(reference, outputs):
+   """score many system files against one reference, reading the reference
+   once and streaming all system files side by side. raises ValueError when
+   a file has a different number of sentences or different words"""
+   label_ids = {}
+   gold = read_gold(reference, label_ids)
+   counters = [corpus_eval() for path in outputs]
+   missing = object()
+   files = [gold] + [depio.depread(path) for path in outputs]
+   for index, sents in enumerate(itertools.izip_longest(*files, fillvalue=missing)):
+      if sents[0] is missing:
+         path = outputs[[sent is missing for sent in sents[1:]].index(False)]
+         raise ValueError('%s has more sentences than %s (sentence %d)' % (path, reference, index))
+      words, heads, labels, mask = sents[0]
+      for path, counter, sent in zip(outputs, counters, sents[1:]):
+         if sent is missing:
+            raise ValueError('%s ends at sentence %d, %s has more' % (path, index, reference))
+         if [word[1] for word in sent] != words:
+            raise ValueError('%s sentence %d has different words than %s' % (path, index, reference))
+         counter.add(np.array([int(word[6]) for word in sent]),
+                     np.array([label_ids.get(word[7], -1) for word in sent]),
+                     heads, labels, mask)
+   return counters
+
+def print_table(outputs, results):
+   width = max([len(path) for path in outputs] + [len('system')])
+   print '%-*s  %-6s  %-6s  %-6s' % (width, 'system', 'UAS', 'LAS', 'UEM')
+   for path, res in zip(outputs, results):
+      print '%-*s  %.4f  %.4f  %.4f' % (width, path, res[0], res[1], res[2])
+
 if __name__ == '__main__':
+   if len(sys.argv) > 3 and sys.argv[1] == '-m':
+      # eval.py -m reference output1 output2 ...
+      print_table(sys.argv[3:], evaluate_systems(sys.argv[2], sys.argv[3:]))
+      sys.exit(0)
    file_output = depio.depread(sys.argv[1])
    file_ref = depio.depread(sys.argv[2])
    total_sent = 0
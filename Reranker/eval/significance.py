@@ -0,0 +1,56 @@
+import sys
+import time
+
+import numpy as np
+
+import eval
+
+CHUNK = 1000
+
+def paired_bootstrap(correct_a, total_a, correct_b, total_b, samples=10000, seed=0):
+   """one-sided paired bootstrap p-value that system a beats system b on
+   corpus UAS, from per-sentence correct/total counts (Berg-Kirkpatrick et
+   al. 2012: fraction of resamples whose gain exceeds twice the observed gain)"""
+   correct_a, total_a, correct_b, total_b = [np.asarray(v, dtype='float64') for v in (correct_a, total_a, correct_b, total_b)]
+   delta = correct_a.sum() / total_a.sum() - correct_b.sum() / total_b.sum()
+   rng = np.random.RandomState(seed)
+   n = len(correct_a)
+   exceed = 0
+   for start in range(0, samples, CHUNK):
+      index = rng.randint(0, n, size=(min(CHUNK, samples - start), n))
+      sample = correct_a[index].sum(axis=1) / total_a[index].sum(axis=1) - correct_b[index].sum(axis=1) / total_b[index].sum(axis=1)
+      exceed += int((sample > 2 * delta).sum())
+   return delta, float(exceed) / samples
+
+def approximate_randomization(correct_a, total_a, correct_b, total_b, samples=10000, seed=0):
+   """two-sided approximate randomization p-value: swap the two systems'
+   outputs of every sentence with probability 1/2"""
+   correct_a, total_a, correct_b, total_b = [np.asarray(v, dtype='float64') for v in (correct_a, total_a, correct_b, total_b)]
+   delta = abs(correct_a.sum() / total_a.sum() - correct_b.sum() / total_b.sum())
+   rng = np.random.RandomState(seed)
+   n = len(correct_a)
+   at_least = 0
+   for start in range(0, samples, CHUNK):
+      swap = rng.randint(0, 2, size=(min(CHUNK, samples - start), n)).astype('float64')
+      ca = correct_a.sum() + swap.dot(correct_b - correct_a)
+      ta = total_a.sum() + swap.dot(total_b - total_a)
+      cb = correct_b.sum() + swap.dot(correct_a - correct_b)
+      tb = total_b.sum() + swap.dot(total_a - total_b)
+      at_least += int((np.abs(ca / ta - cb / tb) >= delta - 1e-12).sum())
+   return delta, float(at_least + 1) / (samples + 1)
+
+if __name__ == '__main__':
+   if len(sys.argv) < 4:
+      print "significance.py reference output_a output_b [samples]"
+      sys.exit(1)
+   samples = int(sys.argv[4]) if len(sys.argv) > 4 else 10000
+   counter_a, counter_b = eval.system_counters(sys.argv[1], sys.argv[2:4])
+   correct_a, total_a = counter_a.sentence_counts()
+   correct_b, total_b = counter_b.sentence_counts()
+   start = time.time()
+   delta, p = paired_bootstrap(correct_a, total_a, correct_b, total_b, samples)
+   print 'UAS a %.4f b %.4f delta %.4f' % (counter_a.result()[0], counter_b.result()[0], delta)
+   print 'paired bootstrap p = %.4f (%d samples, %.2fs)' % (p, samples, time.time() - start)
+   start = time.time()
+   delta, p = approximate_randomization(correct_a, total_a, correct_b, total_b, samples)
+   print 'approximate randomization p = %.4f (%d samples, %.2fs)' % (p, samples, time.time() - start)
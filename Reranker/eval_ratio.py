@@ -1,8 +1,11 @@
 import os
+import time
 import dev_reader
 import data_util
 import dependency_model
+import scoring
 from eval import eval as eval_tool
+import numpy as np
 
 DIR = 'd:\\MacShare\\data\\'
 TRAIN = 'train'
@@ -23,89 +26,80 @@ def test_model():
     print 'load params'
     model.set_parmas(os.path.join(DIR,OUTPUT_MODEL))
     print 'addbase'
-    max = 0
-    for i in range(200):
-        res = evaluate_dataset(model,dev_data,True,ratio=0.005*i)
-        if res[0]>max:
-            max = res[0]
+    ratios = 0.005 * np.arange(200)
+    curve, best = sweep_dataset(scoring.score_table(model, dev_data), ratios)
+    print 'dev best ratio %.3f f1score: %.4f' % (best, curve.max())
+    curve, _ = sweep_dataset(scoring.score_table(model, test_data), [best])
+    print 'test ratio %.3f f1score: %.4f' % (best, curve[0])
 
-def evaluate_baseline(data):
-    pred_trees = []
-    gold_trees = []
-    for i, inst in enumerate(data):
-        for line in inst.lines[len(inst.kbest)-1]:
-            pred_trees.append(line)
-        pred_trees.append('\n')
-        for line in inst.gold_lines:
-            gold_trees.append(line)
-        gold_trees.append('\n')
-    print 'baseline: %.4f' % (eval_tool.evaluate(pred_trees,gold_trees)[0])
 
+def sweep_dataset(table, ratios):
+    model_scores, base_scores, correct, total = scoring.sweep_inputs(table)
+    return scoring.sweep(model_scores, base_scores, correct, total, ratios)
 
-def evaluate_oracle_worst(data):
-    oracle_trees = []
-    worst_trees = []
-    gold_trees = []
-    pred_trees = []
+def evaluate_baseline(data):
+    counter = eval_tool.corpus_eval()
     for i, inst in enumerate(data):
-        max = 0
-        maxid = 0
-        min = 1
-        minid = 0
-        for line in inst.gold_lines:
-            gold_trees.append(line)
-        gold_trees.append('\n')
+        inst.add_eval(counter, inst.k-1)
+    print 'baseline: %.4f' % (counter.result()[0])
 
-        for line in inst.lines[len(inst.kbest)-1]:
-            pred_trees.append(line)
-        pred_trees.append('\n')
 
-        i = 0
-        for list in inst.lines:
-            temp = []
-            for line in list:
-                temp.append(line)
-            temp.append('\n')
-            res = eval_tool.evaluate(temp, inst.gold_lines)[0]
-            if res > max :
-                max = res
-                maxid = i
-            if res < min :
-                min = res
-                minid = i
-            i += 1
-        for line in inst.lines[maxid]:
-            oracle_trees.append(line)
-        oracle_trees.append('\n')
-        for line in inst.lines[minid]:
-            worst_trees.append(line)
-        worst_trees.append('\n')
-    print 'f1score: %.4f'  % (eval_tool.evaluate(pred_trees, gold_trees)[0])
-    print 'oracle: %.4f'  % (eval_tool.evaluate(oracle_trees, gold_trees)[0])
-    print 'worst: %.4f'  % (eval_tool.evaluate(worst_trees, gold_trees)[0])
+def evaluate_oracle_worst(*datasets):
+    for res in scoring.bounds(*datasets):
+        print 'f1score: %.4f'  % (res['last'])
+        print '1-best: %.4f'  % (res['1-best'])
+        print 'oracle: %.4f'  % (res['oracle'])
+        print 'worst: %.4f'  % (res['worst'])
+        print 'random: %.4f'  % (res['random'])
 
 
-def evaluate_dataset(model, data , addbase ,ratio = 1):
-    pred_trees = []
-    gold_trees = []
+def evaluate_dataset(model, data , addbase ,ratio = 1, counter = None, table = None):
+    # pass a corpus_eval as counter to keep the per-sentence counts. Without
+    # table every candidate is rescored on each call: callers evaluating the
+    # same model and data more than once (e.g. over several ratios) should
+    # hold one scoring.score_table and pass it in
+    counter = counter if counter is not None else eval_tool.corpus_eval()
+    table = table if table is not None else scoring.score_table(model, data)
+    model_scores = table.get()
     for i, inst in enumerate(data):
-        pred_scores = [model.predict(tree) for tree in inst.kbest if tree.size == inst.gold.size]
-        data_util.normalize(pred_scores)
-        if addbase:
-            data_util.normalize(inst.scores)
-            scores = [ratio*p_s + (1-ratio)*b_s for p_s, b_s in zip(pred_scores, inst.scores)]
-        else:
-            scores = pred_scores
-        max_id = scores.index(max(scores))
-        #print "pred: %.4f    base: %.4f" % (pred_scores[max_id],inst.scores[max_id])
-        for line in inst.lines[max_id]:
-            pred_trees.append(line)
-        pred_trees.append('\n')
-        for line in inst.gold_lines:
-            gold_trees.append(line)
-        gold_trees.append('\n')
-    res = eval_tool.evaluate(pred_trees,gold_trees)
+        max_id = scoring.select(inst, model_scores[i], addbase, ratio)
+        inst.add_eval(counter, max_id)
+    res = counter.result()
     print 'f1score: %.4f' % (res[0])
     return res
+
+
+def evaluate_pruned(model, data, ratio, counter=None):
+    """evaluate_dataset with addbase, skipping candidates that cannot beat
+    the leader at this ratio (see scoring.score_pruned)."""
+    counter = counter if counter is not None else eval_tool.corpus_eval()
+    bound = scoring.output_bound(model)
+    scored = 0
+    total = 0
+    for inst in data:
+        model_scores, n = scoring.score_pruned(model, inst, ratio, bound)
+        inst.add_eval(counter, scoring.select(inst, model_scores, True, ratio))
+        scored += n
+        total += inst.k
+    res = counter.result()
+    print 'f1score: %.4f pruned %.1f%% of %d candidates' % (res[0], 100.0 * (total - scored) / total, total)
+    return res
+
+
+def pruning_speedup(model, data, ratio):
+    """Time full scoring against pruned scoring at ratio."""
+    start = time.time()
+    model_scores = scoring.score_table(model, data).get()
+    counter = eval_tool.corpus_eval()
+    for i, inst in enumerate(data):
+        inst.add_eval(counter, scoring.select(inst, model_scores[i], True, ratio))
+    full = counter.result()
+    full_time = time.time() - start
+    start = time.time()
+    pruned = evaluate_pruned(model, data, ratio)
+    pruned_time = time.time() - start
+    print 'full %.2fs pruned %.2fs speedup %.2fx%s' % (full_time, pruned_time, full_time / pruned_time,
+                                                       '' if full == pruned else ' RESULTS DIFFER')
+    return full_time / pruned_time
 if __name__ == '__main__':
     test_model()
@@ -0,0 +1,105 @@
+"""Delta-encoded k-best files.
+
+Neighbouring parses in a k-best list differ from the 1-best parse in only a
+few arcs, so every block stores the 1-best candidate in full and each
+candidate (in its original order) as a list of edits against it:
+
+    PTB_KBEST_DELTA
+    <k> <index of the 1-best candidate>
+    <score>\t<id>:<head>:<label> <id>:<head>:<label> ...
+    ...                                   (k score/edit lines)
+    <CoNLL lines of the 1-best candidate>
+    <blank line>
+
+Edit ids are CoNLL token ids (1-based).
+
+usage: python kbest_delta.py input.kbest output.kbest.delta
+"""
+import os
+import sys
+import data_util
+from eval import depio
+
+HEADER = 'PTB_KBEST_DELTA'
+
+
+def encode_block(candidates, scores):
+    floats = [float(s) for s in scores]
+    base = floats.index(max(floats)) if floats else 0
+    arcs = [data_util.read_arcs(c) for c in candidates]
+    base_heads, base_labels = arcs[base]
+    retval = [HEADER + '\n', '%d %d\n' % (len(candidates), base)]
+    for score, (heads, labels) in zip(scores, arcs):
+        edits = ['%d:%d:%s' % (i + 1, h, l)
+                 for i, (h, l, bh, bl) in enumerate(zip(heads, labels, base_heads, base_labels))
+                 if h != bh or l != bl]
+        retval.append('%s\t%s\n' % (score, ' '.join(edits)))
+    retval.extend(candidates[base])
+    retval.append('\n')
+    return ''.join(retval)
+
+
+def write_delta(kbest_filename, output_filename):
+    reader = depio.smart_open(kbest_filename)
+    output = open(output_filename, 'w')
+    candidates = []
+    scores = []
+    tree = []
+    for line in reader:
+        if line.strip() == 'PTB_KBEST':
+            if candidates:
+                output.write(encode_block(candidates, scores))
+            candidates = []
+            scores = []
+        elif line.strip() == '':
+            candidates.append(tree)
+            tree = []
+        elif not '_' in line:
+            scores.append(line.strip())
+        else:
+            tree.append(line)
+    if candidates:
+        output.write(encode_block(candidates, scores))
+    reader.close()
+    output.close()
+
+
+def read_kbest(kbest_data, vocab):
+    """Yield (table, heads, labels, scores, vals) for every delta block with
+    more than one candidate, and None for the others so the blocks stay
+    aligned with the gold file, decoding the edits as the block is read."""
+    lines = iter(kbest_data)
+    for line in lines:
+        if line.strip() != HEADER:
+            continue
+        k, base = [int(v) for v in next(lines).split()]
+        edit_lines = [next(lines) for _ in range(k)]
+        tree = []
+        line = next(lines, '')
+        while line.strip() != '':
+            tree.append(line)
+            line = next(lines, '')
+        if k <= 1:
+            yield None
+            continue
+        table, base_heads, base_labels = data_util.read_table(tree)
+        heads = []
+        labels = []
+        scores = []
+        for edit_line in edit_lines:
+            score, _, edits = edit_line.rstrip('\r\n').partition('\t')
+            scores.append(float(score))
+            h = base_heads[:]
+            l = base_labels[:]
+            for edit in edits.split():
+                id, head, label = edit.split(':', 2)
+                h[int(id) - 1] = int(head)
+                l[int(id) - 1] = label
+            heads.append(h)
+            labels.append(l)
+        yield table, heads, labels, scores, data_util.get_vals(tree, vocab)
+
+
+if __name__ == '__main__':
+    write_delta(sys.argv[1], sys.argv[2])
+    print 'input %d bytes, delta %d bytes' % (os.path.getsize(sys.argv[1]), os.path.getsize(sys.argv[2]))
@@ -0,0 +1,403 @@
+import zlib
+import pickle
+import numpy as np
+import tree_rnn
+import checkpoint
+import data_util
+
+PARAM_NAMES = checkpoint.PARAM_NAMES
+GATE_NAMES = checkpoint.GATE_NAMES
+# stored at reduced precision by quantized_scorer: the embedding table is
+# the bulk of the weights, the matrices and biases stay float32
+QUANTIZED = ['embeddings']
+PRECISIONS = ['float32', 'float16', 'int8']
+SUBTREE_CACHE_SIZE = 100000
+MAX_CACHED_SUBTREE = 4  # nodes
+
+
+def buffer_children(row, t, num_leaves):
+    """Node indices of the children in row t of a gen_nn_inputs tree as
+    compute_tree (irregular_tree) resolves them: it reads children from a
+    rolling buffer of 2 x num_leaves states and Theano wraps negative
+    positions, so a child finished long ago resolves to another node."""
+    window = 2 * num_leaves
+    children = row[:-1][row[:-1] > -1]
+    pos = children + num_leaves - t
+    slot = t + np.where(pos < 0, pos + window, pos)
+    return np.where(slot < window, slot % num_leaves, slot - num_leaves)
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+class subtree_cache(object):
+    """Bounded LRU of the (h, c) of small subtrees, shared across sentences.
+    A key is the word ids and shape of the subtree plus the checksum of the
+    parameters that computed it, so states of other parameters never match."""
+    def __init__(self, capacity=SUBTREE_CACHE_SIZE, max_size=MAX_CACHED_SUBTREE):
+        self.entries = data_util.lru_cache(capacity)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, h, c):
+        self.entries.put(key, (h, c))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        with self.entries.lock:
+            state_bytes = sum(h.nbytes + c.nbytes for h, c in self.entries.items.values())
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / float(lookups) if lookups else 0.0,
+                'entries': len(self.entries.items),
+                'state_bytes': state_bytes,
+                'bypassed_trees': self.bypassed}
+
+    def report(self):
+        return 'subtree cache: %(hits)d hits %(misses)d misses hit rate %(hit_rate).3f ' \
+               '%(entries)d entries %(state_bytes)d state bytes %(bypassed_trees)d trees bypassed' % self.stats()
+
+
+class numpy_scorer(object):
+    """Read-only NumPy copy of a DependencyModel's parameters that computes
+    the same scores as model.predict without Theano."""
+    def __init__(self, params, degree, param_version=0):
+        for name in PARAM_NAMES:
+            setattr(self, name, params[name])
+        # the compare gate is only needed for pairwise selection
+        for name in GATE_NAMES:
+            if name in params:
+                setattr(self, name, params[name])
+        self.gates_loaded = all(name in params for name in GATE_NAMES)
+        self.degree = degree
+        self.param_version = param_version
+        self.cache = None
+        self.checksum = None
+
+    def param_checksum(self):
+        if self.checksum is None:
+            checksum = 0
+            for name in PARAM_NAMES:
+                checksum = zlib.adler32(np.ascontiguousarray(getattr(self, name)).data, checksum)
+            self.checksum = checksum
+        return self.checksum
+
+    def node_states(self, x, tree):
+        """h and c of every node, leaves first, in gen_nn_inputs order."""
+        num_leaves = len(x) - len(tree)
+        emb_x = self.embeddings[x] * (x != -1)[:, np.newaxis]
+        h = np.zeros((len(x), len(self.b_i)), dtype=self.b_i.dtype)
+        c = np.zeros_like(h)
+        leaf_x = emb_x[:num_leaves]
+        i = sigmoid(np.dot(leaf_x, self.W_i.T) + self.b_i)
+        o = sigmoid(np.dot(leaf_x, self.W_o.T) + self.b_o)
+        u = np.tanh(np.dot(leaf_x, self.W_u.T) + self.b_u)
+        c[:num_leaves] = i * u
+        h[:num_leaves] = o * np.tanh(c[:num_leaves])
+        children = [buffer_children(row, t, num_leaves) for t, row in enumerate(tree)]
+        if self.cache is not None:
+            if all(np.array_equal(resolved, row[:-1][row[:-1] > -1]) for resolved, row in zip(children, tree)):
+                self.cached_internal_states(x, tree, emb_x, h, c, children)
+                return h, c
+            # a wrapped buffer read makes states depend on more than the subtree
+            self.cache.bypassed += 1
+        for row, resolved in zip(tree, children):
+            self.internal_unit(emb_x[row[-1]], h, c, resolved, row[-1])
+        return h, c
+
+    def cached_internal_states(self, x, tree, emb_x, h, c, children):
+        """Internal node states through self.cache. An entry holds the states
+        of every node of a small subtree, so the largest cached subtrees are
+        looked up top-down and fill their descendants; the other small
+        subtrees are computed and stored."""
+        keys = [(int(val),) for val in x]
+        members = [[node] for node in range(len(x))]
+        for row, resolved in zip(tree, children):
+            parent = row[-1]
+            small = all(keys[child] is not None for child in resolved)
+            nodes = [parent] + [node for child in resolved for node in members[child]] if small else []
+            small = small and len(nodes) <= self.cache.max_size
+            keys[parent] = (int(x[parent]),) + tuple(keys[child] for child in resolved) if small else None
+            members[parent] = nodes if small else None
+        version = self.param_checksum()
+        covered = np.zeros(len(x), dtype=bool)
+        for row, resolved in reversed(zip(tree, children)):
+            parent = row[-1]
+            if covered[parent] or keys[parent] is None:
+                continue
+            value = self.cache.get((version, keys[parent]))
+            if value is not None:
+                h[members[parent]], c[members[parent]] = value
+                covered[members[parent]] = True
+        for row, resolved in zip(tree, children):
+            parent = row[-1]
+            if covered[parent]:
+                continue
+            self.internal_unit(emb_x[parent], h, c, resolved, parent)
+            if keys[parent] is not None:
+                self.cache.put((version, keys[parent]), h[members[parent]], c[members[parent]])
+
+    def internal_unit(self, parent_x, h, c, children, parent):
+        child_h = h[children]
+        h_tilde = child_h.sum(axis=0)
+        i = sigmoid(np.dot(self.W_i, parent_x) + np.dot(self.U_i, h_tilde) + self.b_i)
+        o = sigmoid(np.dot(self.W_o, parent_x) + np.dot(self.U_o, h_tilde) + self.b_o)
+        u = np.tanh(np.dot(self.W_u, parent_x) + np.dot(self.U_u, h_tilde) + self.b_u)
+        f = sigmoid(np.dot(self.W_f, parent_x) + np.dot(child_h, self.U_f.T) + self.b_f)
+        c[parent] = i * u + (f * c[children]).sum(axis=0)
+        h[parent] = o * np.tanh(c[parent])
+
+    def gate(self, h, compare_h):
+        """forget_unit: h minus the gated part of the compare tree's state."""
+        f = sigmoid(np.dot(h, self.W_gate.T) + np.dot(compare_h, self.U_gate.T) + self.b_gate)
+        return h - f * compare_h
+
+    def gated_roots(self, x, tree, compare):
+        """Root state of compute_tree_with_gate for the tree of x against each
+        of P compare trees at once; compare holds their ungated h, shape
+        (P, nodes, hidden), in their own gen_nn_inputs order."""
+        num_leaves = len(x) - len(tree)
+        compare = np.asarray(compare).transpose(1, 0, 2)
+        emb_x = self.embeddings[x] * (x != -1)[:, np.newaxis]
+        h = np.zeros(compare.shape, dtype=self.b_i.dtype)
+        c = np.zeros_like(h)
+        leaf_x = emb_x[:num_leaves]
+        i = sigmoid(np.dot(leaf_x, self.W_i.T) + self.b_i)
+        o = sigmoid(np.dot(leaf_x, self.W_o.T) + self.b_o)
+        u = np.tanh(np.dot(leaf_x, self.W_u.T) + self.b_u)
+        # leaf cells are not gated, so they are the same for every compare tree
+        c[:num_leaves] = (i * u)[:, np.newaxis]
+        h[:num_leaves] = self.gate((o * np.tanh(i * u))[:, np.newaxis], compare[:num_leaves])
+        for t, row in enumerate(tree):
+            parent = row[-1]
+            children = buffer_children(row, t, num_leaves)
+            parent_x = emb_x[parent]
+            child_h = h[children]
+            h_tilde = child_h.sum(axis=0)
+            i = sigmoid(np.dot(self.W_i, parent_x) + np.dot(h_tilde, self.U_i.T) + self.b_i)
+            o = sigmoid(np.dot(self.W_o, parent_x) + np.dot(h_tilde, self.U_o.T) + self.b_o)
+            u = np.tanh(np.dot(self.W_u, parent_x) + np.dot(h_tilde, self.U_u.T) + self.b_u)
+            f = sigmoid(np.dot(self.W_f, parent_x) + np.dot(child_h, self.U_f.T) + self.b_f)
+            c[parent] = i * u + (f * c[children]).sum(axis=0)
+            h[parent] = self.gate(o * np.tanh(c[parent]), compare[parent])
+        return h[-1]
+
+    def output(self, final_state):
+        return float(np.dot(self.W_out, final_state) + self.b_out.sum())
+
+    def predict(self, root_node):
+        x, tree = tree_rnn.gen_nn_inputs(root_node, max_degree=self.degree, only_leaves_have_vals=False)
+        h, c = self.node_states(x, tree)
+        return self.output(h[-1])
+
+    def dequantize(self, x):
+        """Full-precision scorer over the words of x, and x renumbered for
+        it; see quantized_scorer. Weights here are already float32."""
+        return self, x
+
+    def predict_many(self, roots):
+        """Scores of many trees, of any sentences, in one batched pass."""
+        inputs = [tree_rnn.gen_nn_inputs(root, max_degree=self.degree, only_leaves_have_vals=False)
+                  for root in roots]
+        return self.score_inputs(inputs)
+
+    def score_inputs(self, inputs):
+        if not inputs:
+            return []
+        if self.cache is not None:
+            return [self.output(self.node_states(x, tree)[0][-1]) for x, tree in inputs]
+        h = self.batch_states(inputs)
+        ends = np.cumsum([len(x) for x, tree in inputs]) - 1
+        return (np.dot(h[ends], self.W_out) + self.b_out.sum()).tolist()
+
+    def batch_states(self, inputs):
+        """h of every node of every (x, tree) of inputs, concatenated. The
+        input projections of all nodes are one matrix product, and internal
+        nodes are computed level by level across all trees (a node's level is
+        one more than its deepest child as buffer_children resolves it), so
+        every level is a handful of matrix products however many trees there
+        are."""
+        x = np.concatenate([x for x, tree in inputs])
+        emb_x = self.embeddings[x] * (x != -1)[:, np.newaxis]
+        hidden = len(self.b_i)
+        W = np.concatenate([self.W_i, self.W_f, self.W_o, self.W_u])
+        xi, xf, xo, xu = np.split(np.dot(emb_x, W.T), 4, axis=1)
+        h = np.empty((len(x), hidden), dtype=self.b_i.dtype)
+        c = np.empty_like(h)
+        level = np.zeros(len(x), dtype='int32')
+        parents = []
+        children = []
+        leaves = []
+        offset = 0
+        for x_tree, tree in inputs:
+            num_leaves = len(x_tree) - len(tree)
+            leaves.append(np.arange(offset, offset + num_leaves))
+            for t, row in enumerate(tree):
+                resolved = buffer_children(row, t, num_leaves) + offset
+                parent = row[-1] + offset
+                level[parent] = level[resolved].max() + 1
+                parents.append(parent)
+                children.append(resolved)
+            offset += len(x_tree)
+        leaves = np.concatenate(leaves)
+        c[leaves] = sigmoid(xi[leaves] + self.b_i) * np.tanh(xu[leaves] + self.b_u)
+        h[leaves] = sigmoid(xo[leaves] + self.b_o) * np.tanh(c[leaves])
+        if not parents:
+            return h
+        parents = np.array(parents)
+        counts = np.array([len(resolved) for resolved in children])
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        children = np.concatenate(children)
+        by_level = np.argsort(level[parents], kind='mergesort')
+        bounds = np.searchsorted(level[parents][by_level], np.arange(1, level.max() + 2))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            rows = by_level[lo:hi]
+            P = parents[rows]
+            C = np.concatenate([children[starts[r]:starts[r] + counts[r]] for r in rows])
+            segments = np.concatenate([[0], np.cumsum(counts[rows])[:-1]])
+            owner = np.repeat(np.arange(len(rows)), counts[rows])
+            child_h = h[C]
+            h_tilde = np.add.reduceat(child_h, segments, axis=0)
+            i = sigmoid(xi[P] + np.dot(h_tilde, self.U_i.T) + self.b_i)
+            o = sigmoid(xo[P] + np.dot(h_tilde, self.U_o.T) + self.b_o)
+            u = np.tanh(xu[P] + np.dot(h_tilde, self.U_u.T) + self.b_u)
+            f = sigmoid(xf[P][owner] + np.dot(child_h, self.U_f.T) + self.b_f)
+            c[P] = i * u + np.add.reduceat(f * c[C], segments, axis=0)
+            h[P] = o * np.tanh(c[P])
+        return h
+
+
+def pack(value, precision):
+    """(data, per-row scale, shape) of value in float16, or in int8 scaled
+    so that each row's largest magnitude maps to 127."""
+    if precision == 'float16':
+        return value.astype('float16'), None, value.shape
+    rows = value.reshape(value.shape[0] if value.ndim > 1 else 1, -1)
+    scale = np.abs(rows).max(axis=1) / 127
+    scale[scale == 0] = 1
+    return np.round(rows / scale[:, np.newaxis]).astype('int8'), scale.astype('float32'), value.shape
+
+
+def unpack(packed, rows=None):
+    """float32 value of a packed array, only the given rows if rows is set."""
+    data, scale, shape = packed
+    if rows is not None:
+        data = data[rows]
+        scale = scale[rows] if scale is not None else None
+        shape = (len(rows),) + shape[1:]
+    if scale is None:
+        return data.astype('float32')
+    return (data * scale[:, np.newaxis]).reshape(shape)
+
+
+class quantized_scorer(numpy_scorer):
+    """numpy_scorer with the embedding table stored in float16 or int8 (one
+    float32 scale per row) and the weight matrices in float32, so the matrix
+    products read them as they are. Each predict_many call unpacks only the
+    embedding rows of the words it scores; peak_rows tracks the largest such
+    gather, see peak_nbytes."""
+    def __init__(self, scorer, precision):
+        self.precision = precision
+        self.degree = scorer.degree
+        self.param_version = scorer.param_version
+        self.cache = None
+        self.checksum = None
+        self.packed = {}
+        for name in PARAM_NAMES:
+            if name in QUANTIZED:
+                self.packed[name] = pack(np.asarray(getattr(scorer, name)), precision)
+            else:
+                setattr(self, name, np.asarray(getattr(scorer, name), dtype='float32'))
+        for name in GATE_NAMES:
+            if hasattr(scorer, name):
+                setattr(self, name, getattr(scorer, name))
+        self.gates_loaded = scorer.gates_loaded
+        self.peak_rows = 0
+
+    def dequantize(self, x):
+        """float32 scorer over the words of x, and x renumbered for it. It
+        shares the weight matrices and holds only the unpacked embedding rows."""
+        ids, inverse = np.unique(x, return_inverse=True)
+        params = dict((name, getattr(self, name)) for name in PARAM_NAMES + GATE_NAMES
+                      if name not in QUANTIZED and hasattr(self, name))
+        params['embeddings'] = unpack(self.packed['embeddings'], ids)
+        self.peak_rows = max(self.peak_rows, len(ids))
+        dense = numpy_scorer(params, self.degree, self.param_version)
+        dense.gates_loaded = self.gates_loaded
+        return dense, np.where(x == -1, -1, inverse)
+
+    def predict(self, root_node):
+        return self.predict_many([root_node])[0]
+
+    def predict_many(self, roots):
+        """Scores of many trees, unpacking their embedding rows once."""
+        inputs = [tree_rnn.gen_nn_inputs(root, max_degree=self.degree, only_leaves_have_vals=False)
+                  for root in roots]
+        if not inputs:
+            return []
+        dense, x = self.dequantize(np.concatenate([x for x, tree in inputs]))
+        ends = np.cumsum([len(x_tree) for x_tree, tree in inputs])
+        return dense.score_inputs([(x_tree, tree) for x_tree, (_, tree) in zip(np.split(x, ends[:-1]), inputs)])
+
+    def nbytes(self):
+        """Resident weight bytes."""
+        return sum(data.nbytes + (scale.nbytes if scale is not None else 0)
+                   for data, scale, shape in self.packed.values()) + \
+            sum(getattr(self, name).nbytes for name in PARAM_NAMES if name not in QUANTIZED)
+
+    def peak_nbytes(self):
+        """Resident weight bytes plus the largest float32 embedding gather so far."""
+        return self.nbytes() + self.peak_rows * self.packed['embeddings'][2][1] * 4
+
+
+def with_precision(scorer, precision):
+    if precision == 'float32':
+        return scorer
+    return quantized_scorer(scorer, precision)
+
+
+def save_params(scorer, output_file):
+    """Write the parameters in the order DependencyModel.set_parmas reads."""
+    output = open(output_file, 'wb')
+    for name in PARAM_NAMES:
+        pickle.dump(getattr(scorer, name), output, protocol=2)
+    output.close()
+
+
+def load_params(input_file, degree):
+    """Read a parameter file written by save_params or data_util.save_model,
+    or a checkpoint (see load_checkpoint)."""
+    if checkpoint.is_checkpoint(input_file):
+        return load_checkpoint(input_file)
+    pkl_file = open(input_file, 'rb')
+    params = dict((name, pickle.load(pkl_file)) for name in PARAM_NAMES)
+    pkl_file.close()
+    return numpy_scorer(params, degree)
+
+
+def load_checkpoint(input_file):
+    """Scorer whose parameters are read-only memory maps of a checkpoint
+    written by checkpoint.save_model. The checkpoint's metadata is kept as
+    scorer.meta."""
+    arrays, meta = checkpoint.load_checkpoint(input_file)
+    scorer = numpy_scorer(arrays, meta['degree'], meta.get('param_version', 0))
+    scorer.meta = meta
+    return scorer
+
+
+def from_model(model):
+    """Scorer copy of model, with its compare gate only when the model
+    restored the gate from a checkpoint."""
+    names = PARAM_NAMES + GATE_NAMES if getattr(model, 'gates_loaded', False) else PARAM_NAMES
+    params = dict((name, getattr(model, name).get_value()) for name in names)
+    return numpy_scorer(params, model.degree, model.param_version)
@@ -7,9 +7,8 @@ DEV = 'dev32'
 TEST = 'test32'
 
 if __name__ == '__main__':
-    test_data = dev_reader.read_dev(os.path.join(DIR, DEV + '.kbest'),
+    dev_data = dev_reader.read_dev(os.path.join(DIR, DEV + '.kbest'),
                                     os.path.join(DIR, DEV + '.gold'), None)
-    parser_test.evaluate_oracle_worst(test_data)
     test_data = dev_reader.read_dev(os.path.join(DIR,TEST+'.kbest'),
                          os.path.join(DIR,TEST+'.gold'),None)
-    parser_test.evaluate_oracle_worst(test_data)
\ No newline at end of file
+    parser_test.evaluate_oracle_worst(dev_data, test_data)
\ No newline at end of file
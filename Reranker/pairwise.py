@@ -0,0 +1,103 @@
+import numpy as np
+import tree_rnn
+import np_model
+from eval import eval as eval_tool
+
+METHODS = ['knockout', 'round_robin', 'copeland']
+
+
+class comparison(object):
+    """Pairwise comparator over the candidates of one sentence, the inference
+    side of train_margin: with b as the compared tree, a beats b when
+    out(gate(a | states_b)) > out(gate(b | states_b)). Every candidate's
+    ungated states and self-gated score are computed once and reused by all
+    the pairs it takes part in."""
+    def __init__(self, scorer, roots):
+        self.scorer = scorer
+        self.inputs = [tree_rnn.gen_nn_inputs(root, max_degree=scorer.degree, only_leaves_have_vals=False)
+                       for root in roots]
+        self.states = np.array([scorer.node_states(x, tree)[0] for x, tree in self.inputs])
+        self.self_scores = np.array([scorer.output(scorer.gated_roots(x, tree, self.states[b:b+1])[0])
+                                     for b, (x, tree) in enumerate(self.inputs)])
+        self.pairs = 0
+
+    def cross_scores(self, a, bs):
+        """out(gate(a | states_b)) for every b in bs, in one batched pass."""
+        x, tree = self.inputs[a]
+        roots = self.scorer.gated_roots(x, tree, self.states[bs])
+        self.pairs += len(bs)
+        return np.dot(roots, self.scorer.W_out) + self.scorer.b_out.sum()
+
+    def margins(self):
+        """M[a, b] = out(gate(a | states_b)) - out(gate(b | states_b))."""
+        k = len(self.self_scores)
+        cross = np.array([self.cross_scores(a, np.arange(k)) for a in range(k)])
+        return cross - self.self_scores[np.newaxis, :]
+
+    def knockout(self):
+        best = 0
+        for j in range(1, len(self.self_scores)):
+            if self.self_scores[j] > self.cross_scores(best, [j])[0]:
+                best = j
+        return best
+
+    def round_robin(self):
+        """Candidate with the largest total duel margin."""
+        margins = self.margins()
+        return int((margins - margins.T).sum(axis=1).argmax())
+
+    def copeland(self):
+        """Candidate with the most duel wins minus losses."""
+        margins = self.margins()
+        duels = margins - margins.T
+        return int(((duels > 0).sum(axis=1) - (duels < 0).sum(axis=1)).argmax())
+
+
+class theano_comparison(comparison):
+    """comparison on the compiled model: ungated states are computed once per
+    candidate into a tree_rnn.state_buffer and fed to the gated pass."""
+    def __init__(self, model, roots):
+        self.scorer = model
+        self.roots = roots
+        self.buffer = tree_rnn.state_buffer(model)
+        self.self_scores = np.array([self.buffer.self_score(b, root) for b, root in enumerate(roots)])
+        self.pairs = 0
+
+    def cross_scores(self, a, bs):
+        self.pairs += len(bs)
+        return np.array([self.scorer.gated_score(self.roots[a], self.buffer.get(b, self.roots[b]))
+                         for b in bs])
+
+
+def select(scorer, inst, method):
+    """Index of the candidate of inst chosen by pairwise comparison among the
+    candidates that cover the sentence, and the number of pairs evaluated."""
+    size = inst.gold.size
+    trees = list(inst.kbest)
+    usable = [j for j, tree in enumerate(trees) if tree.size == size]
+    if len(usable) < 2:
+        return (usable or [0])[0], 0
+    if isinstance(scorer, np_model.numpy_scorer):
+        compare = comparison(scorer, [trees[j] for j in usable])
+    else:
+        compare = theano_comparison(scorer, [trees[j] for j in usable])
+    return usable[getattr(compare, method)()], compare.pairs
+
+
+def evaluate_dataset(model, data, method='knockout', counter=None, compiled=False):
+    """Pairwise selection on data with the NumPy scorer, or with the compiled
+    model's gated_score when compiled is set."""
+    if not compiled and not isinstance(model, np_model.numpy_scorer):
+        model = np_model.from_model(model)
+    # the gate is never trained, only a checkpoint holds the one the model was trained with
+    if not getattr(model, 'gates_loaded', False):
+        raise ValueError('pairwise selection needs the compare gate weights, load the model from a checkpoint')
+    counter = counter if counter is not None else eval_tool.corpus_eval()
+    pairs = 0
+    for inst in data:
+        j, n = select(model, inst, method)
+        inst.add_eval(counter, j)
+        pairs += n
+    res = counter.result()
+    print '%s f1score: %.4f (%d pairs)' % (method, res[0], pairs)
+    return res
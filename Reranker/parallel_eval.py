@@ -0,0 +1,68 @@
+import multiprocessing
+import numpy as np
+import np_model
+import scoring
+from eval import eval as eval_tool
+
+CHUNKS_PER_WORKER = 4
+
+# inputs of the worker functions, filled by init_worker in every process
+shared = {}
+
+
+def init_worker(state):
+    shared.clear()
+    shared.update(state)
+
+
+def pool_map(function, items, workers, chunksize=None, **state):
+    """map(function, items) where function reads its inputs from shared.
+    With workers > 1 the state reaches every worker through the pool
+    initializer, so this works whether the pool forks (the state is
+    inherited copy-on-write) or spawns, as on Windows (the state is pickled
+    once per worker). shared is cleared afterwards, also on errors."""
+    init_worker(state)
+    try:
+        if workers == 1:
+            return map(function, items)
+        pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(state,))
+        try:
+            results = pool.map(function, items, chunksize)
+        except:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+        return results
+    finally:
+        shared.clear()
+
+
+def evaluate_chunk(bounds):
+    start, end = bounds
+    scorer = shared['scorer']
+    counter = eval_tool.corpus_eval()
+    for inst in shared['data'][start:end]:
+        model_scores = scoring.score_instance(scorer, inst)
+        inst.add_eval(counter, scoring.select(inst, model_scores, shared['addbase'], shared['ratio']))
+    return counter
+
+
+def evaluate_dataset(model, data, addbase, ratio=1, workers=1, counter=None):
+    """Score-based selection like eval_ratio.evaluate_dataset, with the
+    instances split across worker processes that each hold a NumPy copy of
+    the model parameters (model may already be a numpy_scorer); workers=None
+    uses one per core. Partial counts are merged in instance order into
+    counter if one is given."""
+    workers = workers or multiprocessing.cpu_count()
+    if not isinstance(model, np_model.numpy_scorer):
+        model = np_model.from_model(model)
+    step = max(1, int(np.ceil(len(data) / float(workers * CHUNKS_PER_WORKER))))
+    chunks = [(start, min(start + step, len(data))) for start in range(0, len(data), step)]
+    results = pool_map(evaluate_chunk, chunks, workers, scorer=model, data=data, addbase=addbase, ratio=ratio)
+    counter = counter if counter is not None else eval_tool.corpus_eval()
+    for chunk_counter in results:
+        counter.merge(chunk_counter)
+    res = counter.result()
+    print 'f1score: %.4f' % (res[0])
+    return res
@@ -1,14 +1,20 @@
 import os
 import dev_reader
+import dependency_model
 import data_util
+import np_model
+import scoring
+import pairwise
+import checkpoint
 from eval import eval as eval_tool
 import numpy as np
 DIR = 'd:\\MacShare\\data2\\'
 TRAIN = 'train'
 DEV = 'dev'
 TEST = 'test'
-OUTPUT_MODEL = 'model_8.pkl'
+OUTPUT_CHECKPOINT = 'model_8.ckpt'  # pairwise selection needs the compare gates it holds
 OUTPUT_DICT = 'dict_8.pkl'
+RATIO = 0.5  # weight of the model score against the baseline score with addbase
 
 
 def test_model():
@@ -19,10 +25,9 @@ def test_model():
     #                                     os.path.join(DIR, TEST + '.gold'), vocab)
     #evaluate_oracle_worst(test_data)
     evaluate_oracle_worst(dev_data)
-    print 'build model'
-    model = dependency_model.get_model(vocab.size(), max_degree)
-    print 'load params'
-    model.set_parmas(os.path.join(DIR,OUTPUT_MODEL))
+    print 'load model'
+    model = dependency_model.from_checkpoint(os.path.join(DIR, OUTPUT_CHECKPOINT))
+    checkpoint.check_vocab(model.meta, vocab)
     print 'addbase'
     evaluate_dataset(model,dev_data,True)
     #evaluate_dataset(model, test_data, True)
@@ -32,81 +37,36 @@ def test_model():
 
 
 def evaluate_baseline(data):
-    pred_trees = []
-    gold_trees = []
+    counter = eval_tool.corpus_eval()
     for i, inst in enumerate(data):
-        for line in inst.lines[len(inst.kbest)-1]:
-            pred_trees.append(line)
-        pred_trees.append('\n')
-        for line in inst.gold_lines:
-            gold_trees.append(line)
-        gold_trees.append('\n')
-    print 'baseline: %.4f' % (eval_tool.evaluate(pred_trees,gold_trees)[0])
+        inst.add_eval(counter, inst.k-1)
+    print 'baseline: %.4f' % (counter.result()[0])
 
 
-def evaluate_oracle_worst(data):
-    oracle_trees = []
-    worst_trees = []
-    gold_trees = []
-    pred_trees = []
-    for i, inst in enumerate(data):
-        max = 0
-        maxid = 0
-        min = 1
-        minid = 0
-        for line in inst.gold_lines:
-            gold_trees.append(line)
-        gold_trees.append('\n')
-
-        for line in inst.lines[len(inst.kbest)-1]:
-            pred_trees.append(line)
-        pred_trees.append('\n')
+def evaluate_oracle_worst(*datasets):
+    for res in scoring.bounds(*datasets):
+        print 'f1score: %.4f'  % (res['last'])
+        print '1-best: %.4f'  % (res['1-best'])
+        print 'oracle: %.4f'  % (res['oracle'])
+        print 'worst: %.4f'  % (res['worst'])
+        print 'random: %.4f'  % (res['random'])
 
-        i = 0
-        for list in inst.lines:
-            temp = []
-            for line in list:
-                temp.append(line)
-            temp.append('\n')
-            res = eval_tool.evaluate(temp, inst.gold_lines)[0]
-            if res > max :
-                max = res
-                maxid = i
-            if res < min :
-                min = res
-                minid = i
-            i += 1
-        for line in inst.lines[maxid]:
-            oracle_trees.append(line)
-        oracle_trees.append('\n')
-        for line in inst.lines[minid]:
-            worst_trees.append(line)
-        worst_trees.append('\n')
-    print 'f1score: %.4f'  % (eval_tool.evaluate(pred_trees, gold_trees)[0])
-    print 'oracle: %.4f'  % (eval_tool.evaluate(oracle_trees, gold_trees)[0])
-    print 'worst: %.4f'  % (eval_tool.evaluate(worst_trees, gold_trees)[0])
 
-
-def evaluate_dataset(model, data , addbase):
-    pred_trees = []
-    gold_trees = []
-    for i, inst in enumerate(data):
-        lens = len(inst.kbest)
-        max = 0
-        for j in range(1, lens):
-            loss = 0
-            if inst.kbest[j].size == inst.gold.size:
-                loss = np.mean(self.train_margin(inst.kbest[max],inst.kbest[j]))
-            if loss > 0:
-                max = j
-        for line in inst.lines[max]:
-            pred_trees.append(line)
-        pred_trees.append('\n')
-        for line in inst.gold_lines:
-            gold_trees.append(line)
-        gold_trees.append('\n')
-    res = eval_tool.evaluate(pred_trees,gold_trees)
-    print 'f1score: %.4f' % (res[0])
+def evaluate_dataset(model, data , addbase, method='knockout', ratio=RATIO, table=None):
+    # with addbase the model score mixed with the baseline score selects,
+    # otherwise pairwise selection through the compare gate, see pairwise.METHODS.
+    # Pass a scoring.score_table of model and data to reuse the model scores
+    # across calls (e.g. over several ratios), otherwise they are recomputed
+    if not addbase:
+        return pairwise.evaluate_dataset(model, data, method)
+    if table is None:
+        scorer = np_model.from_model(model) if not isinstance(model, np_model.numpy_scorer) else model
+        table = scoring.score_table(scorer, data)
+    counter = eval_tool.corpus_eval()
+    for inst, model_scores in zip(data, table.get()):
+        inst.add_eval(counter, scoring.select(inst, model_scores, True, ratio))
+    res = counter.result()
+    print 'ratio %.3f f1score: %.4f' % (ratio, res[0])
     return res
 if __name__ == '__main__':
     test_model()
@@ -0,0 +1,72 @@
+import time
+import argparse
+import numpy as np
+import dev_reader
+import np_model
+import rerank
+import scoring
+from eval import eval as eval_tool
+
+
+def weight_bytes(scorer):
+    """Resident and peak weight bytes; the peak adds the float32 embedding
+    rows a quantized scorer unpacks per call."""
+    if isinstance(scorer, np_model.quantized_scorer):
+        return scorer.nbytes(), scorer.peak_nbytes()
+    resident = sum(np.asarray(getattr(scorer, name)).nbytes for name in np_model.PARAM_NAMES)
+    return resident, resident
+
+
+def score_dataset(scorer, data):
+    """Model scores of every instance and the wall time they took."""
+    start = time.time()
+    scores = [scoring.score_instance(scorer, inst) for inst in data]
+    return scores, time.time() - start
+
+
+def uas(data, model_scores, ratio):
+    counter = eval_tool.corpus_eval()
+    for inst, scores in zip(data, model_scores):
+        inst.add_eval(counter, scoring.select(inst, scores, ratio < 1, ratio))
+    return counter.result()[0]
+
+
+def report(scorer, data, ratio, precisions=np_model.PRECISIONS):
+    """Weight size, UAS, score error and throughput of scorer at every
+    precision, against the float32 scores. Reduced precision trades score
+    error for memory; only the embedding table is stored at reduced
+    precision, and unpacking its rows costs throughput. saved is the peak
+    saving against float32."""
+    trees = sum(inst.k for inst in data)
+    reference, _ = score_dataset(scorer, data)
+    base_uas = uas(data, reference, ratio)
+    base_bytes = weight_bytes(scorer)[0]
+    print '%-8s %10s %10s %7s %8s %8s %12s %10s' % ('weights', 'MB', 'peak MB', 'saved', 'UAS', 'delta',
+                                                   'max |diff|', 'trees/s')
+    for precision in precisions:
+        quantized = np_model.with_precision(scorer, precision)
+        scores, elapsed = score_dataset(quantized, data)
+        diff = max(np.abs(np.where(np.isfinite(a), a - b, 0)).max() for a, b in zip(scores, reference))
+        res = uas(data, scores, ratio)
+        resident, peak = weight_bytes(quantized)
+        print '%-8s %10.2f %10.2f %6.1f%% %8.4f %+8.4f %12.2e %10.1f' % (
+            precision, resident / 1e6, peak / 1e6, 100.0 * (1 - peak / float(base_bytes)), res,
+            res - base_uas, diff, trees / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory, accuracy and throughput of reduced-precision weights.')
+    parser.add_argument('dict', help='vocabulary pickle written by data_util.save_dict')
+    parser.add_argument('model', help='parameter file written by data_util.save_model or a checkpoint')
+    parser.add_argument('kbest', help='dev k-best file')
+    parser.add_argument('gold', help='dev gold file')
+    parser.add_argument('-r', '--ratio', type=float, default=1)
+    args = parser.parse_args()
+
+    vocab, scorer = rerank.load_scorer(args.dict, args.model)
+    data = dev_reader.read_dev(args.kbest, args.gold, vocab)
+    report(scorer, data, args.ratio)
+
+
+if __name__ == '__main__':
+    main()
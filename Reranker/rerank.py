@@ -0,0 +1,221 @@
+import sys
+import time
+import argparse
+import itertools
+import numpy as np
+import data_util
+import dev_reader
+import np_model
+import checkpoint
+from eval import depio
+
+BATCH_SIZE = 256
+OUTPUT_BUFFER = 1 << 20
+
+
+def acyclic(heads):
+    """True when every token reaches the root (head 0) by following heads.
+    Pointer jumping: after k rounds jump[i] is the 2^k-th ancestor of i, and
+    0 is its own head, so len(heads) steps end at 0 unless there is a cycle."""
+    jump = np.concatenate([[0], heads])
+    for _ in range(int(np.ceil(np.log2(len(jump))))):
+        jump = jump[jump]
+    return not jump.any()
+
+
+def candidate_tree(scorer, vals, heads):
+    """Tree of one candidate, None when its heads do not form a single tree
+    over the sentence or a node has more children than the model's degree."""
+    if len(heads) != len(vals) or min(heads) < 0 or max(heads) > len(heads):
+        return None
+    if heads.count(0) != 1 or np.bincount(heads, minlength=2)[1:].max() > scorer.degree:
+        return None
+    if not acyclic(heads):
+        return None
+    root = data_util.build_tree(vals, heads)
+    if root is None or root.size != len(heads):
+        return None
+    return root
+
+
+def candidate_score(scorer, vals, lines):
+    """Model score of one candidate, -inf when candidate_tree rejects it."""
+    heads, labels = data_util.read_arcs(lines)
+    root = candidate_tree(scorer, vals, heads)
+    return scorer.predict(root) if root is not None else -np.inf
+
+
+def choose(model_scores, scores, ratio):
+    """Index of the best normalized model score, mixed with the baseline
+    score when ratio < 1; the baseline 1-best when no candidate is usable."""
+    model_scores = data_util.normalize(model_scores)
+    if not np.isfinite(model_scores).any():
+        return int(np.argmax(scores))
+    if ratio < 1:
+        model_scores = np.where(np.isfinite(model_scores),
+                                ratio*model_scores + (1-ratio)*data_util.normalize(np.array(scores)), -np.inf)
+    return int(model_scores.argmax())
+
+
+def scorable(candidates, scores):
+    """Whether a block needs scoring: it has more than one candidate and one
+    baseline score per candidate. A block with missing or extra score lines
+    falls back to its first candidate with a warning."""
+    if len(scores) != len(candidates):
+        sys.stderr.write('warning: k-best block with %d candidates and %d scores, keeping the first candidate\n'
+                         % (len(candidates), len(scores)))
+        return False
+    return len(candidates) > 1
+
+
+def rerank_block(scorer, vocab, candidates, scores, ratio, time_budget=None, node_budget=None):
+    """Selected candidate index of one k-best block and the number of
+    candidates scored. Without a budget all candidates are scored in one
+    predict_many call. With one, candidates are scored in descending baseline
+    order and scoring stops before a candidate whose projected cost would
+    exceed time_budget seconds or node_budget tree nodes; the best of the
+    scored candidates wins, the baseline 1-best when none is usable."""
+    if not scorable(candidates, scores):
+        return 0, 0
+    if time_budget is None and node_budget is None:
+        return rerank_batch(scorer, vocab, [(candidates, scores)], ratio)[0]
+    start = time.time()
+    # dequantize reduced-precision weights once for the block, not per candidate
+    scorer, vals = scorer.dequantize(np.array(data_util.get_vals(candidates[0], vocab)))
+    vals = vals.tolist()
+    size = len(vals)
+    model_scores = np.empty(len(candidates))
+    model_scores.fill(-np.inf)
+    evaluated = 0
+    for j in np.argsort(-np.array(scores), kind='mergesort'):
+        if node_budget is not None and (evaluated + 1) * size > node_budget:
+            break
+        if time_budget is not None and evaluated > 0:
+            elapsed = time.time() - start
+            if elapsed * (evaluated + 1) / evaluated > time_budget:
+                break
+        model_scores[j] = candidate_score(scorer, vals, candidates[j])
+        evaluated += 1
+    return choose(model_scores, scores, ratio), evaluated
+
+
+def rerank_batch(scorer, vocab, batch, ratio=1, time_budget=None, node_budget=None):
+    """(selected index, candidates scored) of every (candidates, scores)
+    block of batch. Without a budget the usable candidates of all blocks
+    are scored together in one predict_many call, each tree once: the model
+    does not see labels, so candidates with the same heads share a score."""
+    if time_budget is not None or node_budget is not None:
+        return [rerank_block(scorer, vocab, candidates, scores, ratio, time_budget, node_budget)
+                for candidates, scores in batch]
+    usable = [scorable(candidates, scores) for candidates, scores in batch]
+    trees = []
+    owners = []
+    for b, (candidates, scores) in enumerate(batch):
+        if not usable[b]:
+            continue
+        vals = data_util.get_vals(candidates[0], vocab)
+        seen = {}
+        for j, lines in enumerate(candidates):
+            heads, labels = data_util.read_arcs(lines)
+            key = tuple(heads)
+            if key in seen:
+                owners[seen[key]][1].append(j)
+                continue
+            root = candidate_tree(scorer, vals, heads)
+            if root is not None:
+                seen[key] = len(trees)
+                trees.append(root)
+                owners.append((b, [j]))
+    model_scores = [np.empty(len(candidates)) for candidates, scores in batch]
+    for row in model_scores:
+        row.fill(-np.inf)
+    for (b, js), score in zip(owners, scorer.predict_many(trees)):
+        model_scores[b][js] = score
+    return [(choose(row, scores, ratio), len(candidates)) if ok else (0, 0)
+            for ok, row, (candidates, scores) in zip(usable, model_scores, batch)]
+
+
+def rerank(scorer, vocab, kbest_data, output, ratio=1, batch_size=BATCH_SIZE,
+           time_budget=None, node_budget=None):
+    """Write the selected tree of every block of kbest_data to output.
+    Returns the number of sentences written."""
+    blocks = dev_reader.read_blocks(kbest_data)
+    count = 0
+    candidates_total = 0
+    evaluated_total = 0
+    truncated = 0
+    start = time.time()
+    while True:
+        batch = list(itertools.islice(blocks, batch_size))
+        if not batch:
+            break
+        out = []
+        for (candidates, scores), (j, evaluated) in zip(
+                batch, rerank_batch(scorer, vocab, batch, ratio, time_budget, node_budget)):
+            out.extend(candidates[j])
+            out.append('\n')
+            if len(candidates) > 1:
+                candidates_total += len(candidates)
+                evaluated_total += evaluated
+                truncated += evaluated < len(candidates)
+        output.write(''.join(out))
+        count += len(batch)
+        elapsed = time.time() - start
+        sys.stderr.write('\r%d sentences %.1f sent/s' % (count, count / max(elapsed, 1e-9)))
+    output.flush()
+    sys.stderr.write('\n')
+    if time_budget is not None or node_budget is not None:
+        sys.stderr.write('scored %d of %d candidates, %d sentences cut short by the budget\n' % (
+            evaluated_total, candidates_total, truncated))
+    return count
+
+
+def load_scorer(dict_file, model_file, precision='float32'):
+    """Vocabulary and NumPy scorer; model_file may be a pickled parameter
+    file or a checkpoint, whose vocabulary hash is checked."""
+    degree, vocab = data_util.load_dict(dict_file)
+    scorer = np_model.load_params(model_file, degree)
+    if hasattr(scorer, 'meta'):
+        checkpoint.check_vocab(scorer.meta, vocab)
+    return vocab, np_model.with_precision(scorer, precision)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rerank a PTB_KBEST stream and write the selected trees as CoNLL.')
+    parser.add_argument('dict', help='vocabulary pickle written by data_util.save_dict')
+    parser.add_argument('model', help='parameter file written by data_util.save_model or a checkpoint')
+    parser.add_argument('input', nargs='?', default='-', help='k-best file, - for stdin')
+    parser.add_argument('-o', '--output', default='-', help='CoNLL output file, - for stdout')
+    parser.add_argument('-r', '--ratio', type=float, default=1,
+                        help='weight of the model score against the baseline score')
+    parser.add_argument('-b', '--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--time-budget', type=float, help='milliseconds of scoring per sentence')
+    parser.add_argument('--node-budget', type=int, help='tree nodes scored per sentence')
+    parser.add_argument('--precision', choices=np_model.PRECISIONS, default='float32',
+                        help='storage precision of the weights; saves memory, not time')
+    parser.add_argument('--subtree-cache', type=int, default=0,
+                        help='entries of the cross-sentence subtree state cache, 0 to disable; '
+                             'candidates are then scored tree by tree instead of batched')
+    args = parser.parse_args()
+    if args.subtree_cache > 0 and args.precision != 'float32':
+        # quantized scorers score through a fresh dequantized copy on every call
+        parser.error('--subtree-cache needs --precision float32')
+
+    vocab, scorer = load_scorer(args.dict, args.model, args.precision)
+    if args.subtree_cache > 0:
+        scorer.cache = np_model.subtree_cache(args.subtree_cache)
+    reader = sys.stdin if args.input == '-' else depio.smart_open(args.input)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', OUTPUT_BUFFER)
+    time_budget = args.time_budget / 1000.0 if args.time_budget is not None else None
+    start = time.time()
+    count = rerank(scorer, vocab, reader, output, args.ratio, args.batch_size, time_budget, args.node_budget)
+    elapsed = time.time() - start
+    sys.stderr.write('reranked %d sentences in %.2fs, %.1f sent/s\n' % (count, elapsed, count / max(elapsed, 1e-9)))
+    if getattr(scorer, 'cache', None) is not None:
+        sys.stderr.write(scorer.cache.report() + '\n')
+    if output is not sys.stdout:
+        output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import time
+import socket
+import argparse
+import threading
+import numpy as np
+import dev_reader
+import rerank_server
+from eval import depio
+
+
+def encode_block(candidates, scores):
+    out = ['PTB_KBEST\n']
+    for lines, score in zip(candidates, scores):
+        out.append('%r\n' % score)
+        out.extend(lines)
+        out.append('\n')
+    out.append(rerank_server.END + '\n')
+    return ''.join(out)
+
+
+def connect(address):
+    if isinstance(address, tuple):
+        sock = socket.create_connection(address)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+    return sock
+
+
+class client(object):
+    def __init__(self, address):
+        self.sock = connect(address)
+        self.reader = self.sock.makefile('rb')
+
+    def rerank(self, request):
+        """Send one encoded block and return the selected tree's lines."""
+        self.sock.sendall(request)
+        lines = []
+        for line in self.reader:
+            if line.strip() == '':
+                break
+            lines.append(line)
+        return lines
+
+    def stats(self):
+        self.sock.sendall(rerank_server.STATS + '\n')
+        return self.reader.readline().strip()
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+def load_test(address, requests, connections, total):
+    """Send total requests over concurrent connections, cycling through
+    requests. Returns the wall time and the per-request latencies."""
+    latencies = [[] for _ in range(connections)]
+
+    def worker(n):
+        conn = client(address)
+        for i in range(n, total, connections):
+            start = time.time()
+            conn.rerank(requests[i % len(requests)])
+            latencies[n].append(time.time() - start)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(connections)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, np.concatenate([np.array(l) for l in latencies])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load generator for rerank_server.')
+    parser.add_argument('kbest', help='k-best file to replay')
+    parser.add_argument('--unix', help='Unix socket path, overrides --host/--port')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8741)
+    parser.add_argument('-c', '--connections', type=int, default=8)
+    parser.add_argument('-n', '--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    with depio.smart_open(args.kbest) as reader:
+        requests = [encode_block(c, s) for c, s in dev_reader.read_blocks(reader)]
+    address = args.unix or (args.host, args.port)
+    elapsed, latencies = load_test(address, requests, args.connections, args.requests)
+    latencies *= 1000
+    print '%d requests over %d connections in %.2fs, %.1f req/s' % (
+        len(latencies), args.connections, elapsed, len(latencies) / elapsed)
+    print 'client latency p50 %.2fms p90 %.2fms p99 %.2fms' % tuple(np.percentile(latencies, [50, 90, 99]))
+    conn = client(address)
+    print 'server', conn.stats()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import os
+import time
+import Queue
+import argparse
+import threading
+import SocketServer
+from collections import deque
+import numpy as np
+import dev_reader
+import np_model
+import rerank
+
+MAX_BATCH = 64
+MAX_LATENCY = 0.005
+LATENCY_WINDOW = 10000
+# a request is a PTB_KBEST block followed by this line, the reply is the
+# selected tree in CoNLL followed by a blank line
+END = '.'
+STATS = 'STATS'
+
+
+class pending(object):
+    def __init__(self, block):
+        self.block = block
+        self.start = time.time()
+        self.done = threading.Event()
+        self.result = None
+
+
+class batcher(object):
+    """Collects concurrent requests into batches of at most max_batch blocks.
+    A batch is scored as soon as it is full or its first request has waited
+    max_latency seconds, by a single thread that owns the scorer, with the
+    candidates of all its blocks in one predict_many call."""
+    def __init__(self, scorer, vocab, ratio=1, max_batch=MAX_BATCH, max_latency=MAX_LATENCY,
+                 time_budget=None, node_budget=None):
+        self.scorer = scorer
+        self.vocab = vocab
+        self.ratio = ratio
+        self.time_budget = time_budget
+        self.node_budget = node_budget
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.queue = Queue.Queue()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.batches = 0
+        self.requests = 0
+        self.evaluated = 0
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, block):
+        request = pending(block)
+        self.queue.put(request)
+        request.done.wait()
+        return request.result
+
+    def collect(self):
+        batch = [self.queue.get()]
+        deadline = batch[0].start + self.max_latency
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.time()
+            try:
+                if timeout > 0:
+                    batch.append(self.queue.get(timeout=timeout))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            try:
+                results = self.score([r.block for r in batch])
+            except Exception:
+                # rescore one block at a time so only the failing request gets an error
+                results = [self.score_one(r.block) for r in batch]
+            now = time.time()
+            for request, (result, evaluated) in zip(batch, results):
+                request.result = result
+                self.evaluated += evaluated
+                self.latencies.append(now - request.start)
+                request.done.set()
+            self.batches += 1
+            self.requests += len(batch)
+
+    def score(self, blocks):
+        """All blocks of a batch in one rerank.rerank_batch call."""
+        return rerank.rerank_batch(self.scorer, self.vocab, blocks, self.ratio,
+                                   self.time_budget, self.node_budget)
+
+    def score_one(self, block):
+        try:
+            return self.score([block])[0]
+        except Exception:
+            return None, 0
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if len(latencies) else (0, 0, 0)
+        return 'queue %d requests %d batches %d mean_batch %.2f mean_scored %.2f p50 %.2fms p90 %.2fms p99 %.2fms' % (
+            self.queue.qsize(), self.requests, self.batches, self.requests / float(max(self.batches, 1)),
+            self.evaluated / float(max(self.requests, 1)), p50, p90, p99)
+
+
+class handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        lines = []
+        for line in self.rfile:
+            command = line.strip()
+            if command == STATS:
+                self.wfile.write(self.server.batcher.stats() + '\n')
+            elif command == END:
+                self.reply(lines)
+                lines = []
+            else:
+                lines.append(line)
+            self.wfile.flush()
+
+    def reply(self, lines):
+        blocks = list(dev_reader.read_blocks(lines))
+        if len(blocks) != 1:
+            self.wfile.write('ERROR expected one PTB_KBEST block\n\n')
+            return
+        j = self.server.batcher.submit(blocks[0])
+        if j is None:
+            self.wfile.write('ERROR scoring failed\n\n')
+            return
+        self.wfile.write(''.join(blocks[0][0][j]) + '\n')
+
+
+class tcp_server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class unix_server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(batcher, address):
+    """Unix socket server when address is a path, TCP when it is (host, port)."""
+    if isinstance(address, tuple):
+        server = tcp_server(address, handler)
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        server = unix_server(address, handler)
+    server.batcher = batcher
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve reranking requests over a local socket.')
+    parser.add_argument('dict', help='vocabulary pickle written by data_util.save_dict')
+    parser.add_argument('model', help='parameter file written by data_util.save_model or a checkpoint')
+    parser.add_argument('--unix', help='Unix socket path, overrides --host/--port')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8741)
+    parser.add_argument('-r', '--ratio', type=float, default=1)
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--max-latency', type=float, default=MAX_LATENCY, help='seconds')
+    parser.add_argument('--time-budget', type=float, help='milliseconds of scoring per sentence')
+    parser.add_argument('--node-budget', type=int, help='tree nodes scored per sentence')
+    parser.add_argument('--precision', choices=np_model.PRECISIONS, default='float32',
+                        help='storage precision of the weights; saves memory, not time')
+    args = parser.parse_args()
+
+    vocab, scorer = rerank.load_scorer(args.dict, args.model, args.precision)
+    time_budget = args.time_budget / 1000.0 if args.time_budget is not None else None
+    address = args.unix or (args.host, args.port)
+    server = make_server(batcher(scorer, vocab, args.ratio, args.max_batch, args.max_latency,
+                                 time_budget, args.node_budget), address)
+    print 'serving on %s' % (address,)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    if args.unix:
+        os.remove(args.unix)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,37 @@
 import data_util
 import dependency_model
-import parser_test
+import parallel_eval
+import background_eval
 import os
 import numpy as np
 import data_reader
+import checkpoint
 DIR = 'd:\\MacShare\\data\\'
 TRAIN = 'train'
 DEV = 'dev'
 TEST = 'test'
 OUTPUT_MODEL = 'model.pkl'
 OUTPUT_BEST = 'model_best.pkl'
+OUTPUT_BEST_CHECKPOINT = 'model_best.ckpt'
+OUTPUT_CHECKPOINT = 'model.ckpt'  # named parameters, gates and adagrad state
 OUTPUT_DICT = 'dict.pkl'
+CACHE_DIR = 'cache'
 TRAIN_BATCH_SIZE = 3
 FINE_GRAINED = False
 DEPENDENCY = False
 SEED = 88
 
 NUM_EPOCHS = 100
+EVAL_WORKERS = 1  # dev evaluation processes, None for one per core
+# evaluate a dev subsample every EVAL_EVERY updates in a background thread
+# and stop after PATIENCE evaluations without improvement
+BACKGROUND_EVAL = False
+EVAL_EVERY = 2000
+EVAL_SAMPLE = 300
+PATIENCE = 10
 
 
-def train_dataset(model, data, echo):
+def train_dataset(model, data, echo, evaluator=None):
     losses = []
     avg_loss = 0.0
     total_data = len(data)
@@ -28,6 +40,10 @@ def train_dataset(model, data, echo):
         loss = model.train_step2(inst)  # labels will be determined by model
         losses.append(loss)
         print 'instance: %s  loss: %s' %(i,loss)
+        if evaluator is not None:
+            evaluator.maybe_submit(model, EVAL_EVERY)
+            if evaluator.should_stop():
+                break
         #avg_loss = avg_loss * (len(losses) - 1) / len(losses) + loss / len(losses)
         #print 'echo %d batch %d avg loss %.4f example id %d batch size %d\r' % (echo ,batch,avg_loss, inst.id, total_data)
     loss = np.mean(losses)
@@ -38,24 +54,43 @@ def train_model():
     data_tool = data_reader.data_manager(TRAIN_BATCH_SIZE,os.path.join(DIR,TRAIN+'.kbest'),
                          os.path.join(DIR,TRAIN+'.gold'),
                          os.path.join(DIR, DEV + '.kbest'),
-                         os.path.join(DIR, DEV + '.gold'),vocab_path= os.path.join(DIR, OUTPUT_DICT))
+                         os.path.join(DIR, DEV + '.gold'),vocab_path= os.path.join(DIR, OUTPUT_DICT),
+                         cache_dir=os.path.join(DIR, CACHE_DIR))
     data = data_tool.train_data
-    for inst in data:
-        inst.set_f1()
     dev_data = data_tool.dev_data
     print 'build model'
     model = dependency_model.get_model(data_tool.vocab.size(), data_tool.max_degree)
     print 'model established'
     max_uas = 0
-    parser_test.evaluate_dataset(model, dev_data, False)
+    if BACKGROUND_EVAL:
+        evaluator = background_eval.background_evaluator(dev_data, EVAL_SAMPLE, PATIENCE,
+                                                         os.path.join(DIR, OUTPUT_BEST),
+                                                         os.path.join(DIR, OUTPUT_BEST_CHECKPOINT),
+                                                         data_tool.vocab)
+        for i in range(NUM_EPOCHS):
+            print 'Echo %d train , data size: %d' % (i, len(data))
+            train_dataset(model, data, i, evaluator)
+            data_util.save_model(model, os.path.join(DIR, OUTPUT_MODEL))
+            checkpoint.save_model(model, os.path.join(DIR, OUTPUT_CHECKPOINT), data_tool.vocab)
+            if evaluator.should_stop():
+                print 'early stop at echo %d' % i
+                break
+        evaluator.wait()
+        evaluator.submit(model, final=True)
+        evaluator.wait()
+        print 'best score %.4f' % evaluator.best_uas
+        return
+    parallel_eval.evaluate_dataset(model, dev_data, False, workers=EVAL_WORKERS)
     for i in range(NUM_EPOCHS):
         print 'Echo %d train , data size: %d' % (i, len(data))
         train_dataset(model, data ,i)
-        uas = parser_test.evaluate_dataset(model, dev_data , False)[0]
+        uas = parallel_eval.evaluate_dataset(model, dev_data, False, workers=EVAL_WORKERS)[0]
         if uas > max_uas:
             max_uas = uas
             data_util.save_model(model, os.path.join(DIR,OUTPUT_BEST))
+            checkpoint.save_model(model, os.path.join(DIR, OUTPUT_BEST_CHECKPOINT), data_tool.vocab)
         data_util.save_model(model, os.path.join(DIR, OUTPUT_MODEL))
+        checkpoint.save_model(model, os.path.join(DIR, OUTPUT_CHECKPOINT), data_tool.vocab)
     print 'best score %.4f' % max_uas
 
 if __name__ == '__main__':
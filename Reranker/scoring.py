@@ -0,0 +1,153 @@
+import numpy as np
+import data_util
+
+class score_table(object):
+    """Model score of every candidate of a dataset, aligned with the
+    instances. Scores are computed once per parameter version of the model
+    and recomputed only after its parameters change; callers keep the table
+    for as long as they evaluate the same model on the same data. Candidates
+    whose tree does not cover the sentence score -inf so they are never
+    selected."""
+    def __init__(self, model, data):
+        self.model = model
+        self.data = data
+        self.version = None
+        self.scores = None
+
+    def get(self):
+        if self.version != self.model.param_version:
+            self.scores = [score_instance(self.model, inst) for inst in self.data]
+            self.version = self.model.param_version
+        return self.scores
+
+
+def score_instance(model, inst):
+    size = inst.gold.size
+    if not hasattr(model, 'predict_many'):
+        return np.array([model.predict(tree) if tree.size == size else -np.inf
+                         for tree in inst.kbest], dtype='float64')
+    # NumPy scorers take the whole list, so per-sentence work is done once
+    scores = np.empty(inst.k)
+    scores.fill(-np.inf)
+    trees = list(inst.kbest)
+    usable = [j for j, tree in enumerate(trees) if tree.size == size]
+    scores[usable] = model.predict_many([trees[j] for j in usable])
+    return scores
+
+
+def select(inst, model_scores, addbase, ratio):
+    """Index of the candidate with the best normalized model score, mixed
+    with the normalized baseline score when addbase is set."""
+    pred_scores = data_util.normalize(model_scores)
+    if addbase:
+        scores = np.where(np.isfinite(pred_scores),
+                          ratio*pred_scores + (1-ratio)*inst.norm_scores, -np.inf)
+    else:
+        scores = pred_scores
+    return int(scores.argmax())
+
+
+def output_bound(model):
+    """Upper bound of model.predict: the root state h lies in (-1, 1), so
+    W_out.h + b_out < ||W_out||_1 + b_out."""
+    W_out, b_out = model.W_out, model.b_out
+    if hasattr(W_out, 'get_value'):
+        W_out, b_out = W_out.get_value(), b_out.get_value()
+    return float(np.abs(W_out).sum() + b_out.sum())
+
+
+def score_pruned(model, inst, ratio, bound=None):
+    """Model scores of the candidates of inst that can still win under
+    interpolation at ratio, visited in descending baseline order. The mixed
+    score differs from ratio * raw + (1 - ratio) * norm_scores by a constant,
+    so once ratio * bound + (1 - ratio) * norm_scores[j] falls below the best
+    mixed score so far, j and every later candidate are skipped (-inf).
+    select() on the result picks the same candidate as on the full scores.
+    Returns the scores and the number of candidates scored."""
+    bound = output_bound(model) if bound is None else bound
+    size = inst.gold.size
+    scores = np.empty(inst.k)
+    scores.fill(-np.inf)
+    best = -np.inf
+    scored = 0
+    for j in np.argsort(-inst.norm_scores, kind='mergesort'):
+        base = (1-ratio) * inst.norm_scores[j] if ratio < 1 else 0
+        if ratio * bound + base < best:
+            break
+        tree = inst.kbest[j]
+        if tree.size != size:
+            continue
+        scores[j] = model.predict(tree)
+        scored += 1
+        best = max(best, ratio * scores[j] + base)
+    return scores, scored
+
+
+def pad(rows, fill):
+    """Stack ragged per-instance rows into an (instances x k) matrix."""
+    width = max(len(row) for row in rows)
+    matrix = np.empty((len(rows), width), dtype='float64')
+    matrix.fill(fill)
+    for i, row in enumerate(rows):
+        matrix[i, :len(row)] = row
+    return matrix
+
+
+def sweep_inputs(table):
+    """Padded model scores, normalized baseline scores and correct-head counts
+    of a score table's dataset, plus the number of scored tokens."""
+    return sweep_matrices(table.data, table.get())
+
+
+def sweep_matrices(data, model_scores):
+    """sweep_inputs for per-instance model scores computed elsewhere."""
+    model = data_util.normalize(pad(model_scores, -np.inf))
+    base = pad([inst.norm_scores for inst in data], -np.inf)
+    correct = pad([inst.correct_heads() for inst in data], 0).astype('int64')
+    total = sum(int(inst.mask.sum()) for inst in data)
+    return model, base, correct, total
+
+
+def sweep(model, base, correct, total, ratios, chunk_size=1 << 22):
+    """Corpus UAS of selecting argmax(r * model + (1 - r) * base) for every
+    ratio r in one broadcasted pass. Padding and unusable candidates must be
+    -inf in model. Returns the UAS curve and the best ratio."""
+    ratios = np.asarray(ratios, dtype='float64')
+    valid = np.isfinite(model)
+    model = np.where(valid, model, 0)
+    rows = np.arange(len(correct))
+    step = max(1, chunk_size // model.size)
+    curve = np.empty(len(ratios))
+    for start in range(0, len(ratios), step):
+        r = ratios[start:start + step, None, None]
+        combined = np.where(valid, r * model + (1 - r) * base, -np.inf)
+        choice = combined.argmax(axis=2)
+        curve[start:start + step] = correct[rows, choice].sum(axis=1) / float(total)
+    return curve, ratios[curve.argmax()]
+
+
+def bounds(*datasets):
+    """Oracle, worst, 1-best (highest baseline score), last-candidate and
+    expected random-selection UAS of every dataset, from one padded matrix
+    of per-candidate correct-head counts over all of them."""
+    data = [inst for dataset in datasets for inst in dataset]
+    correct = pad([inst.correct_heads() for inst in data], -1)
+    valid = correct >= 0
+    rows = np.arange(len(data))
+    k = valid.sum(axis=1)
+    selected = {
+        'oracle': correct.max(axis=1),
+        'worst': np.where(valid, correct, np.inf).min(axis=1),
+        '1-best': correct[rows, [inst.base for inst in data]],
+        'last': correct[rows, k - 1],
+        'random': np.where(valid, correct, 0).sum(axis=1) / k,
+    }
+    total = np.array([inst.mask.sum() for inst in data], dtype='float64')
+    retval = []
+    start = 0
+    for dataset in datasets:
+        end = start + len(dataset)
+        retval.append(dict((name, counts[start:end].sum() / total[start:end].sum())
+                           for name, counts in selected.items()))
+        start = end
+    return retval
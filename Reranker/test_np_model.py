@@ -0,0 +1,38 @@
+import numpy as np
+import data_util
+import dependency_model
+import np_model
+import tree_rnn
+from test_scoring import WORDS, DEGREE, random_heads
+
+# a chain under the root next to a leaf: the root reads that leaf from a
+# slot of the rolling state buffer that has been overwritten since
+WRAP_HEADS = [0, 1, 1, 3, 4, 5, 6]
+
+
+def wraps(scorer, root):
+    x, tree = tree_rnn.gen_nn_inputs(root, max_degree=scorer.degree, only_leaves_have_vals=False)
+    num_leaves = len(x) - len(tree)
+    return any(not np.array_equal(np_model.buffer_children(row, t, num_leaves), row[:-1][row[:-1] > -1])
+               for t, row in enumerate(tree))
+
+
+def test_numpy_scorer_matches_theano():
+    np.random.seed(0)
+    model = dependency_model.get_model(len(WORDS), DEGREE)
+    scorer = np_model.from_model(model)
+    rng = np.random.RandomState(0)
+    trees = []
+    for n in range(2, 10):
+        vals = list(rng.randint(len(WORDS), size=n))
+        trees.append(data_util.build_tree(vals, random_heads(n, rng)))
+    trees.append(data_util.build_tree(range(len(WRAP_HEADS)), WRAP_HEADS))
+    assert wraps(scorer, trees[-1])
+    expected = [float(model.predict(root)) for root in trees]
+    assert np.allclose([scorer.predict(root) for root in trees], expected, atol=1e-5)
+    assert np.allclose(scorer.predict_many(trees), expected, atol=1e-5)
+
+
+if __name__ == '__main__':
+    test_numpy_scorer_matches_theano()
+    print 'test_numpy_scorer_matches_theano ok'
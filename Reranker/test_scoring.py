@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import dev_reader
+import kbest_delta
+import np_model
+import scoring
+from eval import eval as eval_tool
+
+# a small random k-best/gold pair, written to a temporary directory
+WORDS = ['the', 'company', 'said', 'it', 'will', 'buy', 'a', 'stake', 'in', 'firm', ',', '.']
+LABELS = ['nsubj', 'dobj', 'det', 'prep', 'pobj', 'punct', 'root']
+DEGREE = 10
+SENTENCES = 40
+K = 8
+SINGLE = 5  # index of the block with a single candidate
+EMB_DIM = 8
+HIDDEN_DIM = 6
+RATIOS = [0, 0.1, 0.35, 0.5, 0.8, 0.95, 1]
+
+
+def random_heads(n, rng):
+    """1-based heads of a random tree over n tokens, 0 for the root."""
+    order = rng.permutation(n)
+    heads = [0] * n
+    for i in range(1, n):
+        heads[order[i]] = order[rng.randint(i)] + 1
+    return heads
+
+
+def conll(words, heads, labels):
+    return ['%d\t%s\t_\tNN\tNN\t_\t%d\t%s\t_\t_\n' % (i + 1, w, h, l)
+            for i, (w, h, l) in enumerate(zip(words, heads, labels))]
+
+
+def write_sample(directory, seed=0):
+    rng = np.random.RandomState(seed)
+    kbest = open(os.path.join(directory, 'sample.kbest'), 'w')
+    gold = open(os.path.join(directory, 'sample.gold'), 'w')
+    for s in range(SENTENCES):
+        n = rng.randint(2, 9)
+        words = [WORDS[i] for i in rng.randint(len(WORDS), size=n)]
+        gold_heads = random_heads(n, rng)
+        gold.writelines(conll(words, gold_heads, [LABELS[i] for i in rng.randint(len(LABELS), size=n)]))
+        gold.write('\n')
+        kbest.write('PTB_KBEST\n')
+        for j in range(1 if s == SINGLE else K):
+            heads = gold_heads if rng.rand() < 0.2 else random_heads(n, rng)
+            kbest.write('%.4f\n' % rng.uniform(-30, -10))
+            kbest.writelines(conll(words, heads, [LABELS[i] for i in rng.randint(len(LABELS), size=n)]))
+            kbest.write('\n')
+    kbest.close()
+    gold.close()
+    return kbest.name, gold.name
+
+
+def load_sample(seed=0):
+    directory = tempfile.mkdtemp()
+    try:
+        kbest, gold = write_sample(directory, seed)
+        return dev_reader.read_dev(kbest, gold, WORDS)
+    finally:
+        shutil.rmtree(directory)
+
+
+def random_scorer(seed=0, scale=0.5):
+    rng = np.random.RandomState(seed)
+    shapes = {'embeddings': (len(WORDS), EMB_DIM), 'W_out': (HIDDEN_DIM,), 'b_out': (1,)}
+    for gate in 'ifou':
+        shapes['W_' + gate] = (HIDDEN_DIM, EMB_DIM)
+        shapes['U_' + gate] = (HIDDEN_DIM, HIDDEN_DIM)
+        shapes['b_' + gate] = (HIDDEN_DIM,)
+    params = dict((name, (scale * rng.randn(*shapes[name])).astype('float32')) for name in np_model.PARAM_NAMES)
+    return np_model.numpy_scorer(params, DEGREE)
+
+
+def uas(data, choices):
+    counter = eval_tool.corpus_eval()
+    for inst, j in zip(data, choices):
+        inst.add_eval(counter, j)
+    return counter.result()[0]
+
+
+def test_kbest_delta_round_trip():
+    directory = tempfile.mkdtemp()
+    try:
+        kbest, gold = write_sample(directory)
+        delta = os.path.join(directory, 'sample.kbest.delta')
+        kbest_delta.write_delta(kbest, delta)
+        plain = list(dev_reader.read_kbest(open(kbest).readlines() + ['PTB_KBEST'], WORDS))
+        decoded = list(kbest_delta.read_kbest(open(delta), WORDS))
+        assert len(plain) == SENTENCES
+        assert plain[SINGLE] is None and decoded[SINGLE] is None
+        for a, b in zip(plain, decoded):
+            assert a == b
+        # read_dev detects the format, both files give the same instances
+        for a, b in zip(dev_reader.read_dev(kbest, gold, WORDS), dev_reader.read_dev(delta, gold, WORDS)):
+            assert a.k == b.k and a.table == b.table and a.scores == b.scores
+            assert all(a.lines[j] == b.lines[j] for j in range(a.k))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_corpus_eval_matches_evaluate():
+    data = load_sample()
+    rng = np.random.RandomState(1)
+    choices = [rng.randint(inst.k) for inst in data]
+    counter = eval_tool.corpus_eval()
+    lines = []
+    gold = []
+    for inst, j in zip(data, choices):
+        inst.add_eval(counter, j)
+        lines += inst.lines[j] + ['\n']
+        gold += inst.gold_lines + ['\n']
+    assert np.allclose(counter.result(), eval_tool.evaluate(lines, gold))
+
+
+def test_sweep_matches_select():
+    data = load_sample()
+    scorer = random_scorer()
+    model_scores = [scoring.score_instance(scorer, inst) for inst in data]
+    model, base, correct, total = scoring.sweep_matrices(data, model_scores)
+    curve, best = scoring.sweep(model, base, correct, total, RATIOS)
+    for ratio, res in zip(RATIOS, curve):
+        expected = uas(data, [scoring.select(inst, scores, True, ratio) for inst, scores in zip(data, model_scores)])
+        assert abs(res - expected) < 1e-12, (ratio, res, expected)
+    assert best == RATIOS[curve.argmax()]
+
+
+def test_score_pruned_selects_same_candidate():
+    data = load_sample()
+    scorer = random_scorer()
+    bound = scoring.output_bound(scorer)
+    skipped = 0
+    for inst in data:
+        full = scoring.score_instance(scorer, inst)
+        for ratio in RATIOS[1:]:
+            pruned, scored = scoring.score_pruned(scorer, inst, ratio, bound)
+            assert scoring.select(inst, pruned, ratio < 1, ratio) == scoring.select(inst, full, ratio < 1, ratio)
+            skipped += inst.k - scored
+    # the bound must actually prune something on this sample
+    assert skipped > 0
+
+
+def test_quantized_scores_close_to_float32():
+    data = load_sample()
+    scorer = random_scorer()
+    reference = [scoring.score_instance(scorer, inst) for inst in data]
+    for precision, tolerance in [('float16', 1e-3), ('int8', 1e-2)]:
+        quantized = np_model.with_precision(scorer, precision)
+        assert quantized.nbytes() < sum(getattr(scorer, name).nbytes for name in np_model.PARAM_NAMES)
+        for inst, expected in zip(data, reference):
+            scores = scoring.score_instance(quantized, inst)
+            assert np.array_equal(np.isfinite(scores), np.isfinite(expected))
+            diff = np.abs(scores - expected)[np.isfinite(expected)]
+            assert diff.max() < tolerance, (precision, diff.max())
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print name, 'ok'
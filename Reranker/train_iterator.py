@@ -1,5 +1,6 @@
 import data_reader
 import tree_rnn
+from eval import depio
 DIR = 'd:\\MacShare\\data\\'
 TRAIN = 'train'
 DEV = 'dev'
@@ -7,10 +8,10 @@ TEST = 'test'
 
 class train_iterator(object):
     def __init__(self, kbest_filename , gold_filename, vocab,batch):
-        with open(kbest_filename, 'r') as reader:
+        with depio.smart_open(kbest_filename) as reader:
             self.data = reader.readlines()
             self.data.append('PTB_KBEST')
-        with open(gold_filename, 'r') as reader:
+        with depio.smart_open(gold_filename) as reader:
             self.gdata = reader.readlines()
         self.kbest_id = 0
         self.vocab = vocab
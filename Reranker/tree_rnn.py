@@ -66,6 +66,26 @@ class BinaryNode(Node):
         return self.children[1]
 
 
+class state_buffer(object):
+    """Ungated states and self-gated scores of the candidates of one
+    instance, computed once per candidate and reused by every pair the
+    candidate takes part in."""
+    def __init__(self, model):
+        self.model = model
+        self.states = {}
+        self.scores = {}
+
+    def get(self, key, root_node):
+        if key not in self.states:
+            self.states[key] = self.model.tree_states_of(root_node)
+        return self.states[key]
+
+    def self_score(self, key, root_node):
+        if key not in self.scores:
+            self.scores[key] = self.model.gated_score(root_node, self.get(key, root_node))
+        return self.scores[key]
+
+
 def gen_nn_inputs(root_node, max_degree=None, only_leaves_have_vals=True,
                   with_labels=False):
     """Given a root node, returns the appropriate inputs to NN.
@@ -193,6 +213,8 @@ class TreeRNN(object):
         self.learning_rate = learning_rate
         self.momentum = momentum
         self.irregular_tree = irregular_tree
+        # bumped on every parameter update so cached scores can be invalidated
+        self.param_version = 0
 
         self.params = []
         self.embeddings = theano.shared(self.init_matrix([self.num_emb, self.emb_dim]))
@@ -238,6 +260,15 @@ class TreeRNN(object):
         self._predict = theano.function([self.x, self.tree],
                                         self.pred_y1)
 
+        # pairwise passes fed with precomputed compare-tree states, compiled
+        # on first use (see tree_states_of, gated_score, train_margin_states)
+        self.compare_states = T.matrix(name='compare_states')
+        self.gate_states_given = self.compute_tree_with_gate(emb_x, self.tree, self.compare_states)
+        self.gate_states_gold_given = self.compute_tree_with_gate(emb_x_gold, self.tree_gold, self.compare_states)
+        self._tree_states = None
+        self._gated_score = None
+        self._train_margin_states = None
+
     def _check_input(self, x, tree):
         assert np.array_equal(tree[:, -1], np.arange(len(x) - len(tree), len(x)))
         if not self.irregular_tree:
@@ -252,8 +283,44 @@ class TreeRNN(object):
         x_gold, tree_gold = gen_nn_inputs(gold_root, max_degree=self.degree, only_leaves_have_vals=False)
         self._check_input(x, tree)
         self._check_input(x_gold, tree_gold)
+        self.param_version += 1
         return self._train_margin(x, tree[:, :-1], x_gold,tree_gold[:, :-1])
 
+    def tree_states_of(self, root_node):
+        """Ungated node states of a tree, the compare_states of its pairs."""
+        if self._tree_states is None:
+            self._tree_states = theano.function([self.x, self.tree], self.tree_states)
+        x, tree = gen_nn_inputs(root_node, max_degree=self.degree, only_leaves_have_vals=False)
+        self._check_input(x, tree)
+        return self._tree_states(x, tree[:, :-1])
+
+    def gated_score(self, root_node, compare_states):
+        """Output of the gated pass of a tree against given compare states."""
+        if self._gated_score is None:
+            self._gated_score = theano.function([self.x, self.tree, self.compare_states],
+                                                self.output_fn(self.gate_states_given[-1]))
+        x, tree = gen_nn_inputs(root_node, max_degree=self.degree, only_leaves_have_vals=False)
+        self._check_input(x, tree)
+        return self._gated_score(x, tree[:, :-1], compare_states)
+
+    def train_margin_states(self, gold_root, pred_root, compare_states):
+        """train_margin with pred_root's ungated states given instead of
+        recomputed. The states are treated as constants, so no gradient flows
+        through the compare tree's ungated pass, and states computed before
+        earlier updates are stale by those updates."""
+        if self._train_margin_states is None:
+            loss = self.loss_fn(self.output_fn(self.gate_states_gold_given[-1]),
+                                self.output_fn(self.gate_states_given[-1]))
+            self._train_margin_states = theano.function(
+                [self.x, self.tree, self.x_gold, self.tree_gold, self.compare_states],
+                [loss], updates=self.adagrad(loss))
+        x, tree = gen_nn_inputs(pred_root, max_degree=self.degree, only_leaves_have_vals=False)
+        x_gold, tree_gold = gen_nn_inputs(gold_root, max_degree=self.degree, only_leaves_have_vals=False)
+        self._check_input(x, tree)
+        self._check_input(x_gold, tree_gold)
+        self.param_version += 1
+        return self._train_margin_states(x, tree[:, :-1], x_gold, tree_gold[:, :-1], compare_states)
+
     def predict(self, root_node):
         x, tree = gen_nn_inputs(root_node, max_degree=self.degree, only_leaves_have_vals=False)
         # x list the val of leaves and internal nodes
@@ -455,11 +522,16 @@ class TreeRNN(object):
         #grads = T.grad(loss, wrt=list(self.params.values()))
         grads = T.grad(loss, self.params)
         updates = OrderedDict()
-
-        for param, grad in zip(self.params, grads):
-            value = param.get_value(borrow=True)
-            accu = theano.shared(np.zeros(value.shape, dtype=value.dtype),
-                                 broadcastable=param.broadcastable)
+        # kept, aligned with self.params, so checkpoints can save them and
+        # every compiled training function shares the same optimizer state
+        if not getattr(self, 'accumulators', None):
+            self.accumulators = []
+            for param in self.params:
+                value = param.get_value(borrow=True)
+                self.accumulators.append(theano.shared(np.zeros(value.shape, dtype=value.dtype),
+                                                       broadcastable=param.broadcastable))
+
+        for param, grad, accu in zip(self.params, grads, self.accumulators):
             accu_new = accu + grad ** 2
             updates[accu] = accu_new
             updates[param] = param - (self.learning_rate * grad /